@@ -1,43 +1,414 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from app.db.session import get_db
+import re
+import json
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from pydantic import BaseModel, Field
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, RedirectResponse
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_db, engine, async_engine
 from app.db.models import Address
+from app.core.reverse_index import ReverseIndex
+from app.core.response_cache import ResponseCache, conditional_response
+from app.core.metrics import observe_rows
 from geoalchemy2.shape import to_shape
-from shapely.geometry import mapping
+from utils.geometry import parse_bbox
+from utils.text import query_forms
+from core.simplify import geometry_column, coordinate_precision
+from core.clusters import CLUSTER_MAX_ZOOM, cell_degrees
+from exports.stream import export_query, aiter_export, agzip
+from exports.export_geojson import GeoJSONWriter
+from exports.export_kml import KMLWriter
+import config
 
 router = APIRouter()
 
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+
+# Started from app.main at startup when REVERSE_INDEX_ENABLED
+reverse_index = ReverseIndex(engine)
+
+# Code lookups and /plots pages; dropped by region as region_changes come in
+response_cache = ResponseCache(config.RESPONSE_CACHE_MAX_BYTES)
+
+# Features are serialized by PostGIS; Python only concatenates the text.
+PLOT_FEATURES_SQL = """
+    SELECT address_id,
+           json_build_object(
+               'type', 'Feature',
+               'geometry', ST_AsGeoJSON({geom}, :precision)::json,
+               'properties', json_build_object('code', canonical_code, 'wilayat_code', wilayat_code)
+           )::text
+    FROM addresses a
+    WHERE {where}
+    ORDER BY address_id
+"""
+
+def plot_features_query(bbox, cursor, limit, zoom=None):
+    where = ["geom IS NOT NULL", "deleted_at IS NULL"]
+    params = {"precision": coordinate_precision(zoom, config.GEOJSON_PRECISION)}
+    if bbox:
+        where.append("geom && ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326)")
+        params.update(zip(("minx", "miny", "maxx", "maxy"), bbox))
+    if cursor is not None:
+        where.append("address_id > :cursor")
+        params["cursor"] = cursor
+    sql = PLOT_FEATURES_SQL.format(geom=geometry_column(zoom), where=" AND ".join(where))
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params["limit"] = limit
+    return text(sql), params
+
+async def stream_feature_collection(query, params):
+    # Own connection so the server-side cursor outlives the request handler
+    yield '{"type":"FeatureCollection","features":['
+    async with async_engine.connect() as conn:
+        result = await conn.stream(query, params)
+        sep = ""
+        count = 0
+        async for rows in result.partitions(config.PLOTS_STREAM_BATCH):
+            yield sep + ",".join(row[1] for row in rows)
+            sep = ","
+            count += len(rows)
+    observe_rows("plots_stream", count)
+    yield "]}"
+
 @router.get("/plots")
-def get_plots(db: Session = Depends(get_db)):
-    addresses = db.query(Address).all()
-    features = []
-    for address in addresses:
-        geom_shape = to_shape(address.geom)
-        geojson_geom = mapping(geom_shape)
-        features.append({
-            "type": "Feature",
-            "geometry": geojson_geom,
-            "properties": {
-                "code": address.canonical_code,
-                "wilayat_code": address.wilayat_code,
-                # Add other properties if needed
-            }
-        })
-    return {
-        "type": "FeatureCollection",
-        "features": features
-    }
+async def get_plots(
+    request: Request,
+    bbox: Optional[str] = Query(None, description="minx,miny,maxx,maxy in lon/lat"),
+    limit: Optional[int] = Query(None, ge=1, description="page size; without limit or cursor every plot is sent"),
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="map zoom; lower zooms get simplified geometry"),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    try:
+        bounds = parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await response_cache.sync(db)
+    # Unpaged requests get the whole collection, as before paging existed,
+    # streamed from a server-side cursor rather than built in memory. Too big
+    # to cache, but it carries validators so a repeat map load is a 304.
+    if stream or (limit is None and cursor is None):
+        key = ("plots_stream", bounds, cursor, limit, zoom)
+        if (unchanged := response_cache.precondition(request, key)) is not None:
+            return unchanged
+        query, params = plot_features_query(bounds, cursor, limit, zoom)
+        return StreamingResponse(stream_feature_collection(query, params), media_type=GEOJSON_MEDIA_TYPE,
+                                 headers=response_cache.validators(key))
+
+    limit = min(limit or config.PLOTS_PAGE_LIMIT, config.PLOTS_MAX_LIMIT)
+    key = ("plots", bounds, cursor, limit, zoom)
+    entry = response_cache.get(key)
+    if entry is None:
+        if (unchanged := response_cache.precondition(request, key)) is not None:
+            return unchanged
+        version = response_cache.version
+        query, params = plot_features_query(bounds, cursor, limit, zoom)
+        rows = (await db.execute(query, params)).all()
+        observe_rows("plots", len(rows))
+        next_cursor = rows[-1][0] if len(rows) == limit else None
+        body = (
+            '{"type":"FeatureCollection","features":['
+            + ",".join(row[1] for row in rows)
+            + '],"next_cursor":' + ("null" if next_cursor is None else str(next_cursor)) + "}"
+        )
+        entry = response_cache.put(key, body.encode(), bounds, version)
+    return conditional_response(request, entry.body, entry.etag, GEOJSON_MEDIA_TYPE, entry.last_modified)
+
+# Cells come from address_clusters, which create_addresses keeps current, so an
+# overview request reads at most CLUSTER_MAX_FEATURES rows of a small table.
+CLUSTERS_SQL = text("""
+    WITH g AS (SELECT CAST(:cell AS float8) AS cell)
+    SELECT json_build_object(
+               'type', 'Feature',
+               'geometry', json_build_object('type', 'Point', 'coordinates',
+                                             json_build_array(round((sum_x / n)::numeric, :precision),
+                                                              round((sum_y / n)::numeric, :precision))),
+               'properties', json_build_object('count', n, 'cell', json_build_array(
+                   cx * g.cell, cy * g.cell, (cx + 1) * g.cell, (cy + 1) * g.cell))
+           )::text
+    FROM address_clusters, g
+    WHERE zoom = :zoom
+      AND cx BETWEEN floor(CAST(:minx AS float8) / g.cell) AND floor(CAST(:maxx AS float8) / g.cell)
+      AND cy BETWEEN floor(CAST(:miny AS float8) / g.cell) AND floor(CAST(:maxy AS float8) / g.cell)
+    ORDER BY n DESC
+    LIMIT :limit
+""")
+
+@router.get("/plots/clusters")
+async def get_plot_clusters(
+    zoom: int = Query(..., ge=0, le=22),
+    bbox: Optional[str] = Query(None, description="minx,miny,maxx,maxy in lon/lat"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Address counts and centroids on a per-zoom grid, largest cells first."""
+    try:
+        bounds = parse_bbox(bbox) if bbox else (-180.0, -90.0, 180.0, 90.0)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    zoom = min(zoom, CLUSTER_MAX_ZOOM)
+    params = dict(zip(("minx", "miny", "maxx", "maxy"), bounds))
+    params.update({
+        "zoom": zoom,
+        "cell": cell_degrees(zoom),
+        "precision": coordinate_precision(zoom, config.GEOJSON_PRECISION),
+        "limit": config.CLUSTER_MAX_FEATURES,
+    })
+    rows = (await db.execute(CLUSTERS_SQL, params)).scalars().all()
+    observe_rows("plot_clusters", len(rows))
+    body = '{"type":"FeatureCollection","features":[' + ",".join(rows) + "]}"
+    return Response(content=body, media_type=GEOJSON_MEDIA_TYPE)
+
+# Codes retired when an address moved to another wilayat (address_gen.reassign_addresses)
+MOVED_CODE_SQL = text("""
+    SELECT a.canonical_code
+    FROM address_code_moves m
+    JOIN addresses a USING (address_id)
+    WHERE m.old_code = :code AND a.deleted_at IS NULL
+""")
 
 @router.get("/addresses/{code}")
-def get_address_by_code(code: str, db: Session = Depends(get_db)):
-    address = db.query(Address).filter(Address.canonical_code == code).first()
-    if not address:
-        raise HTTPException(status_code=404, detail="Address not found")
-    geom_shape = to_shape(address.geom)
-    coords = list(geom_shape.coords) if hasattr(geom_shape, "coords") else []
-    return {
-        "address_id": address.address_id,
-        "canonical_code": address.canonical_code,
-        "wilayat_code": address.wilayat_code,
-        "coordinates": coords
-    }
+async def get_address_by_code(code: str, request: Request, db: AsyncSession = Depends(get_db)):
+    await response_cache.sync(db)
+    key = ("address", code)
+    entry = response_cache.get(key)
+    if entry is None:
+        if (unchanged := response_cache.precondition(request, key)) is not None:
+            return unchanged
+        version = response_cache.version
+        # Only the columns we send; the simplified tiers stay untoasted
+        address = (await db.execute(
+            select(Address.address_id, Address.canonical_code, Address.wilayat_code, Address.geom)
+            .where(Address.canonical_code == code, Address.deleted_at.is_(None))
+            .limit(1)
+        )).first()
+        observe_rows("address", 1 if address else 0)
+        if not address:
+            moved = (await db.execute(MOVED_CODE_SQL, {"code": code})).scalar()
+            if moved:
+                return RedirectResponse(request.url_for("get_address_by_code", code=moved), status_code=301)
+            raise HTTPException(status_code=404, detail="Address not found")
+        geom_shape = to_shape(address.geom)
+        coords = list(geom_shape.coords) if hasattr(geom_shape, "coords") else []
+        body = json.dumps({
+            "address_id": address.address_id,
+            "canonical_code": address.canonical_code,
+            "wilayat_code": address.wilayat_code,
+            "coordinates": coords
+        }, separators=(",", ":"))
+        entry = response_cache.put(key, body.encode(), geom_shape.bounds, version)
+    return conditional_response(request, entry.body, entry.etag, "application/json", entry.last_modified)
+
+class CodeBatch(BaseModel):
+    codes: List[str] = Field(..., max_length=config.BATCH_MAX_ITEMS)
+
+class LatLon(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+
+class PointBatch(BaseModel):
+    points: List[LatLon] = Field(..., max_length=config.BATCH_MAX_ITEMS)
+
+def stream_json_array(items, chunk=1000):
+    """Send already-serialized JSON values as one array, a chunk at a time."""
+    yield "["
+    buf = []
+    sep = ""
+    for item in items:
+        buf.append(item)
+        if len(buf) >= chunk:
+            yield sep + ",".join(buf)
+            sep = ","
+            buf = []
+    if buf:
+        yield sep + ",".join(buf)
+    yield "]"
+
+ADDRESS_BATCH_SQL = text("""
+    SELECT CASE WHEN a.address_id IS NULL THEN 'null' ELSE json_build_object(
+               'address_id', a.address_id,
+               'canonical_code', a.canonical_code,
+               'wilayat_code', a.wilayat_code,
+               'coordinates', CASE WHEN GeometryType(a.geom) = 'POINT'
+                                   THEN json_build_array(json_build_array(ST_X(a.geom), ST_Y(a.geom)))
+                                   ELSE '[]'::json END
+           )::text END
+    FROM unnest(CAST(:codes AS text[])) WITH ORDINALITY AS c(code, ord)
+    LEFT JOIN addresses a ON a.canonical_code = c.code AND a.deleted_at IS NULL
+    ORDER BY c.ord
+""")
+
+@router.post("/addresses/batch")
+async def get_addresses_batch(batch: CodeBatch, db: AsyncSession = Depends(get_db)):
+    """Resolve many codes in one query; the result array matches the request order, null for unknown codes."""
+    rows = (await db.execute(ADDRESS_BATCH_SQL, {"codes": batch.codes})).scalars().all()
+    observe_rows("addresses_batch", len(rows))
+    return StreamingResponse(stream_json_array(rows), media_type="application/json")
+
+REVERSE_KNN_SQL = text("""
+    SELECT p.ord, n.address_id, n.canonical_code, n.wilayat_code, n.contained, n.distance_m
+    FROM unnest(CAST(:lons AS float8[]), CAST(:lats AS float8[])) WITH ORDINALITY AS p(lon, lat, ord)
+    LEFT JOIN LATERAL (
+        SELECT address_id, canonical_code, wilayat_code,
+               ST_Intersects(geom, q.pt) AS contained,
+               ST_Distance(geom::geography, q.pt::geography) AS distance_m
+        FROM addresses, (SELECT ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326) AS pt) q
+        WHERE geom IS NOT NULL AND deleted_at IS NULL
+        ORDER BY geom <-> q.pt
+        LIMIT 1
+    ) n ON true
+    ORDER BY p.ord
+""")
+
+async def reverse_lookup(db, lons, lats):
+    if reverse_index.ready:
+        # CPU-bound; keep it off the event loop
+        return await run_in_threadpool(reverse_index.lookup_many, lons, lats)
+    # Cold worker: index still loading, ask PostGIS (KNN on the GIST index)
+    hits = []
+    for row in (await db.execute(REVERSE_KNN_SQL, {"lons": lons, "lats": lats})).mappings():
+        if row["address_id"] is None or not (row["contained"] or row["distance_m"] <= config.REVERSE_MAX_DISTANCE_M):
+            hits.append(None)
+            continue
+        hit = {k: row[k] for k in ("address_id", "canonical_code", "wilayat_code", "contained", "distance_m")}
+        if hit["contained"]:
+            hit["distance_m"] = 0.0
+        hits.append(hit)
+    return hits
+
+@router.get("/reverse")
+async def reverse_geocode(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    db: AsyncSession = Depends(get_db),
+):
+    if reverse_index.ready:
+        hit = reverse_index.lookup(lon, lat)
+    else:
+        hit = (await reverse_lookup(db, [lon], [lat]))[0]
+    if hit is None:
+        raise HTTPException(status_code=404, detail="No address near this point")
+    return hit
+
+@router.post("/reverse/batch")
+async def reverse_geocode_batch(batch: PointBatch, db: AsyncSession = Depends(get_db)):
+    """Reverse-geocode many points at once; results match the request order, null where nothing is near."""
+    hits = await reverse_lookup(db, [p.lon for p in batch.points], [p.lat for p in batch.points])
+    observe_rows("reverse_batch", len(hits))
+    return StreamingResponse(stream_json_array(json.dumps(h) for h in hits), media_type="application/json")
+
+# Both trigram conditions are served by raw_plots_search_idx (GIN): %> finds
+# plots where some run of words is similar to a query form, the regex finds
+# plots with a word starting with the query. Word-prefix hits rank first.
+SEARCH_SQL = text("""
+    SELECT json_build_object(
+               'address_id', a.address_id,
+               'canonical_code', a.canonical_code,
+               'wilayat_code', a.wilayat_code,
+               'name', r.payload->>'name',
+               'coordinates', json_build_array(ST_X(p.pt), ST_Y(p.pt)),
+               'score', round(s.score::numeric, 3)
+           )::text
+    FROM raw_plots r
+    JOIN addresses a ON a.raw_id = r.raw_id AND a.deleted_at IS NULL
+    CROSS JOIN LATERAL (SELECT coalesce(a.label_point, ST_PointOnSurface(a.geom)) AS pt) p
+    CROSS JOIN LATERAL (
+        SELECT greatest(word_similarity(:q, r.search_text), word_similarity(:alt, r.search_text),
+                        word_similarity(:skeleton, r.search_text))
+               + CASE WHEN r.search_text ~ :word_prefix THEN 1 ELSE 0 END AS score
+    ) s
+    WHERE (r.search_text %> :q OR r.search_text %> :alt OR r.search_text %> :skeleton
+           OR r.search_text ~ :word_prefix)
+      AND r.deleted_at IS NULL
+    ORDER BY s.score DESC, a.address_id
+    LIMIT :limit
+""")
+
+# Codes are matched by prefix on addresses_code_prefix_idx
+CODE_SEARCH_SQL = text("""
+    SELECT json_build_object(
+               'address_id', a.address_id,
+               'canonical_code', a.canonical_code,
+               'wilayat_code', a.wilayat_code,
+               'name', r.payload->>'name',
+               'coordinates', json_build_array(ST_X(p.pt), ST_Y(p.pt)),
+               'score', 1
+           )::text
+    FROM addresses a
+    LEFT JOIN raw_plots r ON r.raw_id = a.raw_id
+    CROSS JOIN LATERAL (SELECT coalesce(a.label_point, ST_PointOnSurface(a.geom)) AS pt) p
+    WHERE a.canonical_code LIKE :prefix AND a.deleted_at IS NULL
+    ORDER BY a.canonical_code
+    LIMIT :limit
+""")
+
+CODE_QUERY = re.compile(r"^OM(-[A-Z0-9]*)*-?$")
+
+@router.get("/search")
+async def search_addresses(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(config.SEARCH_PAGE_LIMIT, ge=1, le=config.SEARCH_MAX_LIMIT),
+    db: AsyncSession = Depends(get_db),
+):
+    """Addresses by code prefix, or by place names in Arabic or English, prefix and fuzzy, best first."""
+    code = q.strip().upper()
+    normalized, alt, skeleton = query_forms(q)
+    if not CODE_QUERY.match(code) and len(normalized) < config.SEARCH_MIN_CHARS:
+        raise HTTPException(status_code=400, detail=f"Query needs at least {config.SEARCH_MIN_CHARS} letters or digits")
+
+    await response_cache.sync(db)
+    key = ("search", code if CODE_QUERY.match(code) else normalized, limit)
+    entry = response_cache.get(key)
+    if entry is None:
+        if (unchanged := response_cache.precondition(request, key)) is not None:
+            return unchanged
+        version = response_cache.version
+        if CODE_QUERY.match(code):
+            rows = (await db.execute(CODE_SEARCH_SQL, {"prefix": code + "%", "limit": limit})).scalars().all()
+        else:
+            await db.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :t, true)"),
+                             {"t": str(config.SEARCH_SIMILARITY)})
+            rows = (await db.execute(SEARCH_SQL, {
+                "q": normalized, "alt": alt, "skeleton": skeleton,
+                "word_prefix": r"\m" + normalized, "limit": limit,
+            })).scalars().all()
+        observe_rows("search", len(rows))
+        # Any change may add or drop a match, so results carry no bbox and go on every change
+        entry = response_cache.put(key, ("[" + ",".join(rows) + "]").encode(), None, version)
+    return conditional_response(request, entry.body, entry.etag, "application/json", entry.last_modified)
+
+EXPORT_WRITERS = {"geojson": GeoJSONWriter, "kml": KMLWriter}
+
+async def stream_export(writer, query, params):
+    async with async_engine.connect() as conn:
+        async for chunk in aiter_export(conn, writer, query, params):
+            yield chunk
+
+@router.get("/export")
+async def export_addresses(
+    format: str = Query("geojson", pattern="^(geojson|kml)$"),
+    bbox: Optional[str] = Query(None, description="minx,miny,maxx,maxy in lon/lat"),
+    wilayat: Optional[List[str]] = Query(None),
+    governorate: Optional[str] = None,
+    gzip: bool = False,
+):
+    """Stream an extract straight from a server-side cursor; nothing is buffered."""
+    try:
+        bounds = parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    writer = EXPORT_WRITERS[format]()
+    query, params = export_query(writer, bounds, wilayat, governorate)
+    chunks = stream_export(writer, query, params)
+    filename = f"addresses.{writer.extension}"
+    if gzip:
+        return StreamingResponse(agzip(chunks), media_type="application/gzip",
+                                 headers={"Content-Disposition": f'attachment; filename="{filename}.gz"'})
+    return StreamingResponse(chunks, media_type=writer.media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
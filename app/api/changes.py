@@ -0,0 +1,60 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_db
+import config
+
+router = APIRouter()
+
+# Rows are ordered by (change_xid, address_id), a range scan on
+# addresses_change_idx. Transactions still running (xid >= the snapshot's
+# xmin) are held back until they finish, so a token never skips a change.
+CHANGES_SQL = text("""
+    SELECT change_xid, address_id,
+           json_build_object(
+               'op', CASE WHEN deleted_at IS NOT NULL THEN 'delete'
+                          WHEN updated_at = created_at THEN 'insert'
+                          ELSE 'update' END,
+               'address_id', address_id,
+               'canonical_code', canonical_code,
+               'wilayat_code', wilayat_code,
+               'updated_at', updated_at,
+               'geometry', CASE WHEN deleted_at IS NULL THEN ST_AsGeoJSON(geom, :precision)::json END
+           )::text
+    FROM addresses
+    WHERE (change_xid, address_id) > (CAST(:xid AS bigint), CAST(:address_id AS integer))
+      AND change_xid < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+    ORDER BY change_xid, address_id
+    LIMIT :limit
+""")
+
+def parse_token(token):
+    """"<xid>.<address_id>" -> (xid, address_id); None means from the beginning."""
+    if not token:
+        return 0, 0
+    xid, _, address_id = token.partition(".")
+    return int(xid), int(address_id)
+
+@router.get("/changes")
+async def get_changes(
+    since: Optional[str] = Query(None, description="next_token from the previous call; omit for a full sync"),
+    limit: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_db),
+):
+    """Addresses inserted, updated or deleted after `since`, oldest first."""
+    try:
+        xid, address_id = parse_token(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid change token")
+    limit = min(limit or config.CHANGES_PAGE_LIMIT, config.CHANGES_MAX_LIMIT)
+    rows = (await db.execute(CHANGES_SQL, {
+        "xid": xid, "address_id": address_id, "limit": limit, "precision": config.GEOJSON_PRECISION,
+    })).all()
+    if rows:
+        xid, address_id = rows[-1][0], rows[-1][1]
+    body = (
+        '{"changes":[' + ",".join(row[2] for row in rows) + "]"
+        + f',"next_token":"{xid}.{address_id}","has_more":{"true" if len(rows) == limit else "false"}}}'
+    )
+    return Response(content=body, media_type="application/json")
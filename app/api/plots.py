@@ -1,35 +1,32 @@
+import logging
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_db
 from app.db.models import Address
+from app.core.metrics import observe_rows
 from geoalchemy2.shape import to_shape
 from shapely.geometry import mapping
 
 router = APIRouter()
 
 @router.get("/plots")
-def get_plots(db: Session = Depends(get_db)):
-    addresses = db.query(Address).all()
-    print(f"[DEBUG] Found {len(addresses)} addresses in DB")
-
-    if not addresses:
-        # Return empty GeoJSON FeatureCollection if no data found
-        return {
-            "type": "FeatureCollection",
-            "features": []
-        }
+async def get_plots(db: AsyncSession = Depends(get_db)):
+    addresses = (await db.execute(select(Address).where(Address.deleted_at.is_(None)))).scalars().all()
+    observe_rows("plots_orm", len(addresses))
 
     features = []
+    skipped = 0
     for address in addresses:
         if not address.geom:
-            print(f"[DEBUG] Address id={address.id} has no geometry, skipping")
+            skipped += 1
             continue
 
         try:
             geom_shape = to_shape(address.geom)
             geojson_geom = mapping(geom_shape)
         except Exception as e:
-            print(f"[WARNING] Invalid geometry for address id={address.id}: {e}")
+            logging.warning(f"Invalid geometry for address id={address.address_id}: {e}")
             continue
 
         features.append({
@@ -41,6 +38,8 @@ def get_plots(db: Session = Depends(get_db)):
                 # Add other desired properties here
             }
         })
+    if skipped:
+        logging.debug(f"Skipped {skipped} addresses without geometry")
 
     return {
         "type": "FeatureCollection",
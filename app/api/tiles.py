@@ -0,0 +1,89 @@
+import logging
+from fastapi import APIRouter, HTTPException, Depends, Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_db
+from app.core.tile_cache import TileCache
+from app.core.response_cache import conditional_response, make_etag
+from core.simplify import geometry_column
+from core.clusters import CLUSTER_MAX_ZOOM, cell_degrees
+import config
+
+router = APIRouter()
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+tile_cache = TileCache(
+    config.TILE_CACHE_MAX_BYTES,
+    cache_dir=config.TILE_CACHE_DIR,
+    max_disk_tiles=config.TILE_DISK_CACHE_MAX_TILES,
+)
+
+TILE_SQL = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(:z, :x, :y) AS env,
+               ST_Transform(ST_TileEnvelope(:z, :x, :y, margin => :margin), 4326) AS query_env
+    ),
+    mvtgeom AS (
+        SELECT ST_AsMVTGeom(ST_Transform({geom}, 3857), bounds.env, :extent, :buffer, true) AS geom,
+               a.canonical_code AS code,
+               a.wilayat_code
+        FROM addresses a, bounds
+        WHERE a.geom && bounds.query_env AND a.deleted_at IS NULL
+        LIMIT :max_features
+    )
+    SELECT ST_AsMVT(mvtgeom.*, 'plots', :extent, 'geom'), count(*) FROM mvtgeom
+"""
+
+# Overview zooms: one point per address_clusters cell instead of every plot
+CLUSTER_TILE_SQL = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(:z, :x, :y) AS env,
+               ST_Transform(ST_TileEnvelope(:z, :x, :y, margin => :margin), 4326) AS query_env,
+               CAST(:cell AS float8) AS cell
+    ),
+    mvtgeom AS (
+        SELECT ST_AsMVTGeom(ST_Transform(ST_SetSRID(ST_MakePoint(c.sum_x / c.n, c.sum_y / c.n), 4326), 3857),
+                            bounds.env, :extent, :buffer, true) AS geom,
+               c.n AS count
+        FROM address_clusters c, bounds
+        WHERE c.zoom = :cluster_zoom
+          AND c.cx BETWEEN floor(ST_XMin(bounds.query_env) / bounds.cell) AND floor(ST_XMax(bounds.query_env) / bounds.cell)
+          AND c.cy BETWEEN floor(ST_YMin(bounds.query_env) / bounds.cell) AND floor(ST_YMax(bounds.query_env) / bounds.cell)
+        ORDER BY c.n DESC
+        LIMIT :max_features
+    )
+    SELECT ST_AsMVT(mvtgeom.*, 'clusters', :extent, 'geom'), count(*) FROM mvtgeom
+"""
+
+@router.get("/tiles/{z}/{x}/{y}.mvt")
+async def get_tile(z: int, x: int, y: int, request: Request, db: AsyncSession = Depends(get_db)):
+    if z < 0 or z > 22 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+
+    await tile_cache.sync(db)
+    key = (z, x, y)
+    tile = tile_cache.get(key)
+    if tile is None:
+        params = {
+            "z": z, "x": x, "y": y,
+            "margin": config.TILE_BUFFER / config.TILE_EXTENT,
+            "extent": config.TILE_EXTENT,
+            "buffer": config.TILE_BUFFER,
+            "max_features": config.TILE_MAX_FEATURES,
+        }
+        # Below TILE_MIN_ZOOM a tile would cover too many plots to build in bounded time
+        if z < config.TILE_MIN_ZOOM:
+            cluster_zoom = min(z, CLUSTER_MAX_ZOOM)
+            params.update(cluster_zoom=cluster_zoom, cell=cell_degrees(cluster_zoom))
+            sql = CLUSTER_TILE_SQL
+        else:
+            sql = TILE_SQL.format(geom=geometry_column(z))
+        tile, count = (await db.execute(text(sql), params)).one()
+        tile = bytes(tile) if tile else b""
+        truncated = count >= config.TILE_MAX_FEATURES
+        if truncated:
+            logging.warning(f"Tile {z}/{x}/{y} hit TILE_MAX_FEATURES ({count}); features past it are left out")
+        tile_cache.put(key, tile, truncated)
+    headers = {"X-Tile-Truncated": "true"} if tile_cache.is_truncated(key) else None
+    return conditional_response(request, tile, make_etag(tile), MVT_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,132 @@
+# metrics.py
+# Request, response and database metrics for the API, served at /metrics in
+# the Prometheus text format together with the default registry.
+import os
+import re
+import time
+import random
+import cProfile
+import logging
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from sqlalchemy import event
+from starlette.responses import Response
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_SECONDS = Histogram(
+    "api_request_seconds", "Request latency until the last body byte is sent",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = Histogram(
+    "api_response_bytes", "Response body size", ["route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864),
+)
+RESPONSE_ROWS = Histogram(
+    "api_response_rows", "Database rows serialized into one response", ["endpoint"],
+    buckets=(0, 1, 10, 100, 500, 1000, 5000, 10000, 50000),
+)
+DB_QUERY_SECONDS = Histogram(
+    "api_db_query_seconds", "Statement execution time", ["engine"], buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CONNECTIONS = Gauge("api_db_pool_connections", "Pooled connections by state", ["engine", "state"])
+DB_POOL_SATURATION = Gauge("api_db_pool_saturation", "Checked-out connections / (pool_size + max_overflow)", ["engine"])
+PROFILES_WRITTEN = Counter("api_profiles_written_total", "cProfile dumps written for slow requests", ["route"])
+
+def observe_rows(endpoint, rows):
+    RESPONSE_ROWS.labels(endpoint).observe(rows)
+
+def instrument_engine(engine, name):
+    """Time every statement on engine and publish its pool usage."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_SECONDS.labels(name).observe(time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    pool = sync_engine.pool
+    capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+    DB_POOL_CONNECTIONS.labels(name, "checked_out").set_function(pool.checkedout)
+    DB_POOL_CONNECTIONS.labels(name, "idle").set_function(pool.checkedin)
+    DB_POOL_CONNECTIONS.labels(name, "overflow").set_function(lambda: max(pool.overflow(), 0))
+    DB_POOL_SATURATION.labels(name).set_function(lambda: pool.checkedout() / capacity)
+
+def route_label(scope):
+    # The route template, not the raw path, keeps the label set bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request to its last body byte, so streamed responses count in full.
+
+    With profile_dir set, a profile_rate fraction of requests runs under
+    cProfile and the stats of those slower than slow_seconds are dumped there
+    (open with `python -m pstats` or snakeviz). The profiler sees the whole
+    event loop thread, so overlapping requests show up in the dump too, and
+    only one request is profiled at a time.
+    """
+
+    def __init__(self, app, slow_seconds=1.0, profile_dir="", profile_rate=0.0):
+        self.app = app
+        self.slow_seconds = slow_seconds
+        self.profile_dir = profile_dir
+        self.profile_rate = profile_rate if profile_dir else 0.0
+        self._profiling = False
+        if self.profile_rate:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        profiler = None
+        if self.profile_rate and not self._profiling and random.random() < self.profile_rate:
+            self._profiling = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            route = route_label(scope)
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            RESPONSE_BYTES.labels(route).observe(size)
+            if elapsed >= self.slow_seconds:
+                logging.warning(f"Slow request {scope['method']} {scope['path']} -> {status} "
+                                f"in {elapsed:.2f}s ({size} bytes)")
+                if profiler is not None:
+                    self._dump(profiler, route, elapsed)
+
+    def _dump(self, profiler, route, elapsed):
+        name = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%dT%H%M%S')}_{name}_{elapsed * 1000:.0f}ms.prof")
+        profiler.dump_stats(path)
+        PROFILES_WRITTEN.labels(route).inc()
+        logging.warning(f"Wrote profile {path}")
+
+def metrics_response():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,156 @@
+# response_cache.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Response
+from sqlalchemy import text
+from utils.geometry import bbox_intersects
+import config
+
+CachedResponse = namedtuple("CachedResponse", "body etag last_modified bbox")
+
+async def latest_change(db):
+    """(version, changed_at) of the newest region_changes row; (0, None) if empty."""
+    return tuple((await db.execute(text(
+        "SELECT coalesce(max(version), 0), max(changed_at) FROM region_changes"
+    ))).one())
+
+async def changes_since(db, version):
+    """Rows of (version, changed_at, bbox) logged after version; bbox is None for "everywhere"."""
+    rows = (await db.execute(text("""
+        SELECT version, changed_at, ST_XMin(bbox), ST_YMin(bbox), ST_XMax(bbox), ST_YMax(bbox)
+        FROM region_changes
+        WHERE version > :version
+        ORDER BY version
+    """), {"version": version})).all()
+    return [(v, at, None if bbox[0] is None else tuple(bbox)) for v, at, *bbox in rows]
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+def version_etag(version, key):
+    """Weak ETag of what key renders to at region_changes version; known before querying."""
+    return 'W/"' + hashlib.blake2b(repr((version, key)).encode(), digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as for GET
+    return etag.removeprefix("W/") in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+
+def not_modified(request, etag, last_modified=None):
+    """True if the request's validators show the client holds this version.
+
+    If-None-Match wins when present (RFC 9110); If-Modified-Since is only
+    compared to last_modified, at the one-second resolution of HTTP dates.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    since = request.headers.get("if-modified-since")
+    if not since or not last_modified:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(since)
+    except (TypeError, ValueError):
+        return False
+
+def validator_headers(etag, last_modified=None, headers=None):
+    # no-cache: browsers keep the body but revalidate, which is a cheap 304
+    headers = {"ETag": etag, "Cache-Control": "no-cache", **(headers or {})}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return headers
+
+def conditional_response(request, body, etag, media_type, last_modified=None, headers=None):
+    """200 with body, or an empty 304 if the client already holds this version."""
+    headers = validator_headers(etag, last_modified, headers)
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+class ResponseCache:
+    """Byte-bounded LRU of rendered responses, each tagged with the bbox it covers.
+
+    Like TileCache it follows region_changes: a logged change drops the
+    entries whose bbox intersects it (entries without a bbox always go).
+    ETags derive from (version, key), so a client revalidating a key that is
+    not cached any more can still get a 304 before anything is queried.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.version = None
+        self.changed_at = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+
+    @property
+    def last_modified(self):
+        return format_datetime(self.changed_at, usegmt=True) if self.changed_at else None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def precondition(self, request, key):
+        """Empty 304 if the client holds key as of the current version, else None; call before querying."""
+        etag = version_etag(self.version, key)
+        if not_modified(request, etag, self.last_modified):
+            return Response(status_code=304, headers=validator_headers(etag, self.last_modified))
+        return None
+
+    def validators(self, key):
+        """ETag and Last-Modified headers of key as of the current version, for responses not cached here."""
+        return validator_headers(version_etag(self.version, key), self.last_modified)
+
+    def put(self, key, body, bbox=None, version=None):
+        """Store body and return its CachedResponse.
+
+        Pass the version seen before querying: if a change was applied in the
+        meantime the body may be stale, so it is returned but not kept.
+        """
+        entry = CachedResponse(body, version_etag(version, key), self.last_modified, bbox)
+        if len(body) > self.max_bytes or version != self.version:
+            return entry
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self._bytes -= len(dropped.body)
+        return entry
+
+    def invalidate(self, bbox=None):
+        """Drop entries intersecting bbox (minx, miny, maxx, maxy), or all entries if None."""
+        with self._lock:
+            keys = [k for k, e in self._entries.items()
+                    if bbox is None or e.bbox is None or bbox_intersects(e.bbox, bbox)]
+            for k in keys:
+                self._bytes -= len(self._entries.pop(k).body)
+
+    async def sync(self, db):
+        """Apply region_changes logged since the last poll (at most every TILE_INVALIDATION_POLL s)."""
+        now = time.monotonic()
+        if now - self._checked_at < config.TILE_INVALIDATION_POLL:
+            return
+        self._checked_at = now
+        if self.version is None:
+            self.version, self.changed_at = await latest_change(db)
+            self.invalidate()
+            return
+        for version, changed_at, bbox in await changes_since(db, self.version):
+            self.invalidate(bbox)
+            self.version, self.changed_at = version, changed_at
@@ -0,0 +1,169 @@
+# reverse_index.py
+import logging
+import threading
+import numpy as np
+import shapely
+from sqlalchemy import text
+from utils.geometry import metres_per_degree
+import config
+
+class ReverseIndex:
+    """Process-local STRtree over addresses for point -> address lookups.
+
+    The tree is built from every live address in a background thread at
+    startup. Every REVERSE_REFRESH_SECONDS it follows the address change feed
+    (change_xid, as /api/changes does): changed and deleted addresses are
+    evicted, the live ones among them added back, and the tree rebuilt only
+    if something changed. Until the first load finishes `ready` is False and
+    callers fall back to PostGIS.
+
+    The tree is in degrees. Candidates within max_distance_m come from it with
+    a radius that is never too small, and their distances are measured in
+    metres with the ellipsoid scale at each query point, as geography does.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._snapshot = None
+        self._token = None  # (change_xid, address_id) of the last change applied
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="reverse-index", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.warning(f"Reverse index refresh failed: {e}")
+            self._stop.wait(config.REVERSE_REFRESH_SECONDS)
+
+    def refresh(self):
+        """Load every live address, or apply the changes since the last call. Returns addresses changed."""
+        with self.engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True, yield_per=config.REVERSE_LOAD_BATCH)
+            if self._token is None:
+                # Changes from transactions at or after xmin may be missing
+                # from the load below, so the feed is replayed from there
+                xmin = conn.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+                rows = conn.execute(text("""
+                    SELECT address_id, canonical_code, wilayat_code, ST_AsBinary(geom)
+                    FROM addresses
+                    WHERE geom IS NOT NULL AND deleted_at IS NULL
+                """))
+                changed, live = None, self._columns(rows)
+                token = (xmin, 0)
+            else:
+                rows = conn.execute(text("""
+                    SELECT change_xid, address_id, canonical_code, wilayat_code,
+                           CASE WHEN deleted_at IS NULL THEN ST_AsBinary(geom) END
+                    FROM addresses
+                    WHERE (change_xid, address_id) > (CAST(:xid AS bigint), CAST(:address_id AS integer))
+                      AND change_xid < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+                    ORDER BY change_xid, address_id
+                """), {"xid": self._token[0], "address_id": self._token[1]}).all()
+                if not rows:
+                    return 0
+                token = (rows[-1][0], rows[-1][1])
+                changed = np.array([row[1] for row in rows], dtype=np.int64)
+                live = self._columns(row[1:] for row in rows if row[4] is not None)
+        self._apply(changed, *live)
+        self._token = token
+        count = len(self._snapshot["ids"]) if changed is None else len(changed)
+        logging.info(f"Reverse index holds {len(self._snapshot['ids'])} addresses ({count} loaded or changed)")
+        return count
+
+    @staticmethod
+    def _columns(rows):
+        ids, codes, wilayats, wkbs = [], [], [], []
+        for address_id, code, wilayat, wkb in rows:
+            ids.append(address_id)
+            codes.append(code)
+            wilayats.append(wilayat)
+            wkbs.append(bytes(wkb))
+        geoms = shapely.from_wkb(np.array(wkbs, dtype=object)) if wkbs else np.array([], dtype=object)
+        return (np.array(ids, dtype=np.int64), np.array(codes, dtype=object),
+                np.array(wilayats, dtype=object), geoms)
+
+    def _apply(self, changed, ids, codes, wilayats, geoms):
+        """Evict the changed ids (all if None), add the given live rows and rebuild the tree."""
+        old = self._snapshot
+        if old is not None and changed is not None:
+            keep = ~np.isin(old["ids"], changed)
+            ids = np.concatenate([old["ids"][keep], ids])
+            codes = np.concatenate([old["codes"][keep], codes])
+            wilayats = np.concatenate([old["wilayats"][keep], wilayats])
+            geoms = np.concatenate([old["geoms"][keep], geoms])
+        # Readers keep using the old snapshot until this assignment
+        self._snapshot = {
+            "tree": shapely.STRtree(geoms),
+            "geoms": geoms,
+            "ids": ids,
+            "codes": codes,
+            "wilayats": wilayats,
+        }
+
+    def _record(self, snap, i, contained, distance_m):
+        return {
+            "address_id": int(snap["ids"][i]),
+            "canonical_code": snap["codes"][i],
+            "wilayat_code": snap["wilayats"][i],
+            "contained": contained,
+            "distance_m": distance_m,
+        }
+
+    def lookup(self, lon, lat, max_distance_m=None):
+        """Containing plot, else nearest within max_distance_m; None if nothing is close enough."""
+        return self.lookup_many([lon], [lat], max_distance_m)[0]
+
+    def lookup_many(self, lons, lats, max_distance_m=None):
+        """Vectorized lookup: one result (or None) per input point, in input order."""
+        n = len(lons)
+        results = [None] * n
+        snap = self._snapshot
+        if snap is None or not len(snap["ids"]) or n == 0:
+            return results
+        lons, lats = np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+        points = shapely.points(lons, lats)
+        tree = snap["tree"]
+
+        inputs, hits = tree.query(points, predicate="intersects")
+        contained, first = np.unique(inputs, return_index=True)
+        for i, k in zip(contained, hits[first]):
+            results[i] = self._record(snap, int(k), True, 0.0)
+
+        missing = np.setdiff1d(np.arange(n), contained)
+        if not len(missing):
+            return results
+        max_distance_m = config.REVERSE_MAX_DISTANCE_M if max_distance_m is None else max_distance_m
+        east, north = metres_per_degree(lats[missing])
+        # A degree of longitude is the shorter one, so this radius covers max_distance_m
+        inputs, hits = tree.query(points[missing], predicate="dwithin",
+                                  distance=max_distance_m / np.minimum(east, north))
+        if not len(inputs):
+            return results
+        # Candidates in local metres around their query point, then plain distances
+        candidates = snap["geoms"][hits]
+        coords, owner = shapely.get_coordinates(candidates, return_index=True)
+        origin = np.column_stack([lons[missing], lats[missing]])[inputs]
+        scale = np.column_stack([east, north])[inputs]
+        local = shapely.set_coordinates(candidates.copy(), (coords - origin[owner]) * scale[owner])
+        distances = shapely.distance(local, shapely.points(0.0, 0.0))
+        order = np.lexsort((distances, inputs))
+        inputs, hits, distances = inputs[order], hits[order], distances[order]
+        near, first = np.unique(inputs, return_index=True)
+        for j, k, d in zip(near, hits[first], distances[first]):
+            if d <= max_distance_m:
+                results[missing[j]] = self._record(snap, int(k), False, float(d))
+        return results
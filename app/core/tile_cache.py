@@ -0,0 +1,171 @@
+# tile_cache.py
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from app.core.response_cache import latest_change, changes_since
+from utils.geometry import bbox_intersects
+import config
+
+def tile_bounds(z, x, y, margin=0.0):
+    """Lon/lat bounds of an XYZ tile, optionally grown by a fraction of its width."""
+    n = 2 ** z
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+    return (
+        (x - margin) / n * 360.0 - 180.0,
+        lat(y + 1 + margin),
+        (x + 1 + margin) / n * 360.0 - 180.0,
+        lat(y - margin),
+    )
+
+class TileCache:
+    """Bounded LRU of encoded tiles in memory, backed by an optional tile directory.
+
+    Invalidation follows the region_changes log written by ingestion and
+    create_addresses: every cached tile intersecting a logged bbox is dropped.
+    Tiles cut off at TILE_MAX_FEATURES are remembered for this process only.
+    """
+
+    def __init__(self, max_bytes, cache_dir="", max_disk_tiles=0):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_tiles = max_disk_tiles
+        self.version = None
+        self._mem = OrderedDict()
+        self._mem_bytes = 0
+        self._disk = OrderedDict()
+        self._truncated = set()
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        if cache_dir:
+            self._load_disk_index()
+
+    def _path(self, key):
+        z, x, y = key
+        return os.path.join(self.cache_dir, str(z), str(x), f"{y}.mvt")
+
+    def _version_path(self):
+        return os.path.join(self.cache_dir, "VERSION")
+
+    def _load_disk_index(self):
+        try:
+            with open(self._version_path()) as f:
+                self.version = int(f.read().strip())
+        except (OSError, ValueError):
+            self.version = None
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".mvt"):
+                    continue
+                parts = os.path.relpath(os.path.join(root, name), self.cache_dir).split(os.sep)
+                try:
+                    key = (int(parts[0]), int(parts[1]), int(parts[2][:-4]))
+                except (IndexError, ValueError):
+                    continue
+                self._disk[key] = None
+
+    def get(self, key):
+        with self._lock:
+            tile = self._mem.get(key)
+            if tile is not None:
+                self._mem.move_to_end(key)
+                return tile
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                tile = f.read()
+        except OSError:
+            with self._lock:
+                self._disk.pop(key, None)
+            return None
+        with self._lock:
+            self._put_mem(key, tile)
+        return tile
+
+    def is_truncated(self, key):
+        return key in self._truncated
+
+    def put(self, key, tile, truncated=False):
+        with self._lock:
+            if truncated:
+                self._truncated.add(key)
+            else:
+                self._truncated.discard(key)
+            self._put_mem(key, tile)
+            if not self.cache_dir:
+                return
+            self._disk[key] = None
+            self._disk.move_to_end(key)
+            evicted = []
+            while len(self._disk) > self.max_disk_tiles:
+                evicted.append(self._disk.popitem(last=False)[0])
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(tile)
+        os.replace(tmp, path)
+        for old in evicted:
+            self._unlink(old)
+
+    def _put_mem(self, key, tile):
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= len(old)
+        if len(tile) > self.max_bytes:
+            return
+        self._mem[key] = tile
+        self._mem_bytes += len(tile)
+        while self._mem_bytes > self.max_bytes:
+            _, dropped = self._mem.popitem(last=False)
+            self._mem_bytes -= len(dropped)
+
+    def _unlink(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def invalidate(self, bbox=None):
+        """Drop tiles intersecting bbox (minx, miny, maxx, maxy), or all tiles if None."""
+        margin = config.TILE_BUFFER / config.TILE_EXTENT
+        with self._lock:
+            if bbox is None:
+                mem_keys, disk_keys = list(self._mem), list(self._disk)
+            else:
+                mem_keys = [k for k in self._mem if bbox_intersects(tile_bounds(*k, margin=margin), bbox)]
+                disk_keys = [k for k in self._disk if bbox_intersects(tile_bounds(*k, margin=margin), bbox)]
+            for k in mem_keys:
+                self._mem_bytes -= len(self._mem.pop(k))
+            for k in disk_keys:
+                del self._disk[k]
+            self._truncated.difference_update(mem_keys)
+            self._truncated.difference_update(disk_keys)
+        for k in disk_keys:
+            self._unlink(k)
+
+    async def sync(self, db):
+        """Apply region_changes logged since the last poll (at most every TILE_INVALIDATION_POLL s)."""
+        now = time.monotonic()
+        if now - self._checked_at < config.TILE_INVALIDATION_POLL:
+            return
+        self._checked_at = now
+        if self.version is None:
+            latest, _ = await latest_change(db)
+            self.invalidate()
+            self._set_version(latest)
+            return
+        for version, _, bbox in await changes_since(db, self.version):
+            self.invalidate(bbox)
+            self._set_version(version)
+
+    def _set_version(self, version):
+        self.version = version
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._version_path(), "w") as f:
+                f.write(str(version))
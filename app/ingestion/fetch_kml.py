@@ -1,20 +1,183 @@
 # fetch_kml.py
-import asyncio
+# The browser is only used to find a map's KML URL (and pick up its session
+# cookies); files are downloaded by one pooled HTTP client with conditional
+# requests. A JSON-lines manifest records every finished URL, so an
+# interrupted crawl resumes where it stopped and a nightly re-crawl mostly
+# gets 304s. KMZ downloads are unpacked to their KML document, since the
+# parsers only read *.kml.
 import os
+import json
+import time
+import random
+import shutil
+import asyncio
+import hashlib
+import logging
+import zipfile
+import argparse
+from contextlib import asynccontextmanager
 from pathlib import Path
-from playwright.async_api import async_playwright
+from urllib.parse import urlsplit
+import httpx
+from utils.metrics import record_fetch, serve as serve_metrics
 
-CONCURRENT = 3
-INTER_MAP_DELAY = 1.0
+CONCURRENCY_START = 4
+CONCURRENCY_MAX = 32
+DISCOVERY_PAGES = 2  # Chromium pages open at once
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # seconds, doubled per attempt
+BACKOFF_MAX = 60.0
+SKIP_FRESH_SECONDS = 12 * 3600
+MANIFEST_NAME = "fetch_manifest.jsonl"
+KML_EXTENSIONS = (".kml", ".kmz")
+USER_AGENT = "omanpostadd-fetcher/1.0"
 
-def sanitize_filename_from_url(url):
+def sanitize_filename(url: str) -> str:
     return url.replace("https://", "").replace("http://", "").replace("/", "_").replace("?", "_").replace("&", "_")
 
-async def download_for_page(browser, url, out_dir):
-    page = await browser.new_page()
-    try:
-        await page.goto(url, timeout=60000)
-        # Find "Export to KML" button or link
+def is_kml_url(url):
+    return urlsplit(url).path.lower().endswith(KML_EXTENSIONS)
+
+def local_filename(url):
+    """File name for url's KML: host and path, plus a hash of any query, always ending in .kml."""
+    parts = urlsplit(url)
+    stem = sanitize_filename(parts.netloc + parts.path)
+    root, ext = os.path.splitext(stem)
+    if ext.lower() in KML_EXTENSIONS:
+        stem = root
+    if parts.query:
+        stem += "_" + hashlib.sha1(parts.query.encode()).hexdigest()[:8]
+    return stem + ".kml"
+
+def unpack_kmz(src, dest):
+    """Write the KML document of the KMZ archive src to dest: doc.kml, else the first root-level .kml."""
+    with zipfile.ZipFile(src) as zf:
+        names = [n for n in zf.namelist() if n.lower().endswith(".kml")]
+        if not names:
+            raise ValueError(f"{src}: KMZ without a KML document")
+        name = "doc.kml" if "doc.kml" in names else min(names, key=lambda n: n.count("/"))
+        with zf.open(name) as inner, open(dest, "wb") as out:
+            shutil.copyfileobj(inner, out)
+
+class Manifest:
+    """Append-only record of fetched URLs; the last line per URL wins."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from a crash
+                    self.entries[entry["url"]] = entry
+        self._file = open(path, "a", encoding="utf-8")
+
+    def get(self, url):
+        return self.entries.get(url) or {}
+
+    def record(self, url, **fields):
+        entry = {**self.get(url), **fields, "url": url, "fetched_at": time.time()}
+        self.entries[url] = entry
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        return entry
+
+    def close(self):
+        self._file.close()
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: one more slot after a window of successes, halved when throttled."""
+
+    def __init__(self, start=CONCURRENCY_START, maximum=CONCURRENCY_MAX):
+        self.limit = start
+        self.maximum = maximum
+        self.active = 0
+        self._successes = 0
+        self._cut_at = 0.0
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.active -= 1
+                self._cond.notify_all()
+
+    def success(self):
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self._successes = 0
+
+    def throttled(self):
+        # Requests already in flight fail together; count that as one signal
+        now = time.monotonic()
+        if now - self._cut_at < 1.0:
+            return
+        self._cut_at = now
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+        logging.info(f"Server pushing back, concurrency now {self.limit}")
+
+def backoff(attempt, retry_after=None):
+    if retry_after is not None:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+class SessionExpired(Exception):
+    pass
+
+class Discoverer:
+    """Headless Chromium, started on first use, that finds the KML URL behind a map page."""
+
+    def __init__(self, client, outdir, pages=DISCOVERY_PAGES):
+        self.client = client
+        self.outdir = outdir
+        self._sem = asyncio.Semaphore(pages)
+        self._lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+
+    async def _get_browser(self):
+        async with self._lock:
+            if self._browser is None:
+                from playwright.async_api import async_playwright
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+            return self._browser
+
+    async def discover(self, url):
+        """Return (kml_url, saved_path). saved_path is set when only the browser could download it."""
+        browser = await self._get_browser()
+        async with self._sem:
+            context = await browser.new_context()
+            page = await context.new_page()
+            try:
+                await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+                # One round trip for every link instead of one per anchor
+                hrefs = await page.eval_on_selector_all("a[href]", "els => els.map(e => e.href)")
+                kml_url = next((h for h in hrefs if is_kml_url(h)), None)
+                saved = None
+                if kml_url is None:
+                    kml_url, saved = await self._export_button(page, url)
+                for c in await context.cookies():
+                    self.client.cookies.set(c["name"], c["value"], domain=c["domain"], path=c["path"])
+                return kml_url, saved
+            finally:
+                await context.close()
+
+    async def _export_button(self, page, url):
         selectors = [
             "text=Export to KML",
             "text=Export KML",
@@ -23,59 +186,188 @@ async def download_for_page(browser, url, out_dir):
             "button:has-text('KML')",
             "a:has-text('KML')"
         ]
-        found = None
         for sel in selectors:
-            el = await page.query_selector(sel)
-            if el:
-                found = el
+            button = await page.query_selector(sel)
+            if button:
                 break
-
-        if not found:
-            print(f"[WARN] Export button not found on {url}")
-            return None
-
+        else:
+            return None, None
         async with page.expect_download(timeout=60000) as download_info:
-            await found.click()
+            await button.click()
         download = await download_info.value
-        filename = sanitize_filename_from_url(url) + "_" + (download.suggested_filename or "omanreal.kml")
-        out_path = os.path.join(out_dir, filename)
-        await download.save_as(out_path)
-        print(f"Saved KML: {out_path}")
-        return out_path
-
-    except Exception as e:
-        print(f"[ERROR] {url} -> {e}")
-        return None
-    finally:
-        await page.close()
-
-async def fetch_all(urls, out_dir):
-    Path(out_dir).mkdir(parents=True, exist_ok=True)
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        sem = asyncio.Semaphore(CONCURRENT)
-
-        async def sem_task(url):
-            async with sem:
-                result = await download_for_page(browser, url, out_dir)
-                await asyncio.sleep(INTER_MAP_DELAY)
-                return result
-
-        tasks = [asyncio.create_task(sem_task(url)) for url in urls]
-        results = await asyncio.gather(*tasks)
-        await browser.close()
-    return results
+        if download.url.startswith(("http://", "https://")):
+            await download.cancel()
+            return download.url, None
+        # blob: or data: export, only the browser can save it
+        path = os.path.join(self.outdir, sanitize_filename(url) + "_" + (download.suggested_filename or "omanreal_export.kml"))
+        await download.save_as(path)
+        root, ext = os.path.splitext(path)
+        if ext.lower() == ".kmz":
+            unpack_kmz(path, root + ".kml")
+            os.remove(path)
+            path = root + ".kml"
+        return None, path
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            await self._playwright.stop()
+
+async def download(client, limiter, manifest, url, kml_url, path, on_request=None):
+    """GET kml_url into path, conditionally if we hold a copy. Returns True if the file changed.
+
+    on_request, if given, is called as on_request(seconds, size) after every attempt.
+    """
+    entry = manifest.get(url)
+    headers = {}
+    if entry.get("kml_url") == kml_url and os.path.exists(path):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    def finished(started, status, size=0):
+        elapsed = time.perf_counter() - started
+        record_fetch(kml_url, status, elapsed, size)
+        if on_request:
+            on_request(elapsed, size)
+
+    for attempt in range(MAX_RETRIES):
+        retry_after = None
+        async with limiter.slot():
+            started = time.perf_counter()
+            try:
+                async with client.stream("GET", kml_url, headers=headers) as resp:
+                    if resp.status_code != 200:
+                        finished(started, resp.status_code)
+                    if resp.status_code == 304:
+                        limiter.success()
+                        manifest.record(url, kml_url=kml_url, path=path, status="unchanged")
+                        return False
+                    if resp.status_code in (401, 403):
+                        raise SessionExpired(kml_url)
+                    if resp.status_code == 429 or resp.status_code >= 500:
+                        limiter.throttled()
+                        retry_after = resp.headers.get("retry-after")
+                    else:
+                        resp.raise_for_status()
+                        digest = hashlib.sha256()
+                        tmp = f"{path}.part"
+                        with open(tmp, "wb") as f:
+                            async for chunk in resp.aiter_bytes(1 << 16):
+                                digest.update(chunk)
+                                f.write(chunk)
+                        with open(tmp, "rb") as f:
+                            kmz = f.read(4) == b"PK\x03\x04"
+                        if kmz:
+                            unpack_kmz(tmp, f"{path}.unpacked")
+                            os.replace(f"{path}.unpacked", path)
+                            os.remove(tmp)
+                        else:
+                            os.replace(tmp, path)
+                        finished(started, resp.status_code, os.path.getsize(path))
+                        limiter.success()
+                        changed = digest.hexdigest() != entry.get("sha256")
+                        manifest.record(url, kml_url=kml_url, path=path, status="fetched",
+                                        etag=resp.headers.get("etag"),
+                                        last_modified=resp.headers.get("last-modified"),
+                                        sha256=digest.hexdigest())
+                        return changed
+            except httpx.TransportError as e:
+                finished(started, "error")
+                limiter.throttled()
+                logging.warning(f"{kml_url}: {e!r}, attempt {attempt + 1}/{MAX_RETRIES}")
+        await asyncio.sleep(backoff(attempt, retry_after))
+    raise RuntimeError(f"{kml_url}: gave up after {MAX_RETRIES} attempts")
+
+async def fetch_all(urls, outdir, on_file=None, skip_fresh=SKIP_FRESH_SECONDS,
+                    concurrency=CONCURRENCY_START, max_concurrency=CONCURRENCY_MAX, on_request=None):
+    """Fetch the KML behind every map URL into outdir.
+
+    on_file, if given, is awaited as on_file(path, changed) for every file on
+    disk once its URL is done, including unchanged and skipped ones, so a
+    consumer can catch up on files an earlier run downloaded but never used.
+    on_request is passed on to download(). Returns counts per outcome.
+    """
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(os.path.join(outdir, MANIFEST_NAME))
+    limiter = AdaptiveLimiter(concurrency, max_concurrency)
+    stats = {"fetched": 0, "unchanged": 0, "skipped": 0, "failed": 0}
+    now = time.time()
+
+    async with httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT},
+        limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        follow_redirects=True,
+    ) as client:
+        discoverer = Discoverer(client, outdir)
+
+        async def fetch_one(url):
+            entry = manifest.get(url)
+            if entry.get("status") in ("fetched", "unchanged") and now - entry["fetched_at"] < skip_fresh:
+                stats["skipped"] += 1
+                if on_file and os.path.exists(entry["path"]):
+                    await on_file(entry["path"], False)
+                return
+            path = entry.get("path", "")
+            if not path.lower().endswith(".kml"):
+                path = os.path.join(outdir, local_filename(url))
+            kml_url = url if is_kml_url(url) else entry.get("kml_url")
+            rediscovered = False
+            try:
+                while True:
+                    if kml_url is None:
+                        kml_url, saved = await discoverer.discover(url)
+                        rediscovered = True
+                        if saved:
+                            manifest.record(url, path=saved, status="fetched")
+                            stats["fetched"] += 1
+                            if on_file:
+                                await on_file(saved, True)
+                            return
+                        if kml_url is None:
+                            raise RuntimeError("no KML link or export button")
+                    try:
+                        changed = await download(client, limiter, manifest, url, kml_url, path, on_request)
+                        break
+                    except SessionExpired:
+                        # Cookies or signed link expired; one fresh browser visit
+                        if rediscovered or is_kml_url(url):
+                            raise
+                        kml_url = None
+                stats["fetched" if changed else "unchanged"] += 1
+                if on_file:
+                    await on_file(path, changed)
+            except Exception as e:
+                stats["failed"] += 1
+                manifest.record(url, status="failed", error=str(e))
+                logging.warning(f"[ERROR] {url} -> {e}")
+
+        try:
+            await asyncio.gather(*(fetch_one(url) for url in dict.fromkeys(urls)))
+        finally:
+            await discoverer.close()
+            manifest.close()
+    logging.info(f"Fetch done: {stats}, final concurrency {limiter.limit}")
+    return stats
 
 def main():
-    import sys
-    if len(sys.argv) < 3:
-        print("Usage: python fetch_kml.py maps.txt ./kmls/")
-        return
-    urls_file = sys.argv[1]
-    out_dir = sys.argv[2]
-    with open(urls_file, "r") as f:
+    parser = argparse.ArgumentParser(description="Download OmanReal map KMLs")
+    parser.add_argument("urls_file", help="one map (or direct .kml) URL per line")
+    parser.add_argument("outdir")
+    parser.add_argument("--skip-fresh", type=float, default=SKIP_FRESH_SECONDS,
+                        help="seconds; URLs fetched more recently are not requested again (resume)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY_START, help="initial parallel downloads")
+    parser.add_argument("--max-concurrency", type=int, default=CONCURRENCY_MAX)
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve Prometheus metrics on this port")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    serve_metrics(args.metrics_port)
+    with open(args.urls_file, "r", encoding="utf-8") as f:
         urls = [line.strip() for line in f if line.strip()]
-    asyncio.run(fetch_all(urls, out_dir))
+    asyncio.run(fetch_all(urls, args.outdir, skip_fresh=args.skip_fresh,
+                          concurrency=args.concurrency, max_concurrency=args.max_concurrency))
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,30 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
-from app.api import addresses  # your existing API router
+from app.api import addresses, changes, tiles  # your existing API router
+from app.db.session import async_engine, engine
+from app.core.metrics import MetricsMiddleware, instrument_engine, metrics_response
 import os
+import config
 
-app = FastAPI(title="Oman Post Addressing System")
+@asynccontextmanager
+async def lifespan(app):
+    if config.REVERSE_INDEX_ENABLED:
+        addresses.reverse_index.start()
+    yield
+    addresses.reverse_index.stop()
+    await async_engine.dispose()
+
+app = FastAPI(title="Oman Post Addressing System", lifespan=lifespan)
+app.add_middleware(
+    MetricsMiddleware,
+    slow_seconds=config.SLOW_REQUEST_SECONDS,
+    profile_dir=config.PROFILE_DIR,
+    profile_rate=config.PROFILE_SAMPLE_RATE,
+)
+instrument_engine(async_engine, "async")
+instrument_engine(engine, "sync")
 
 # Use absolute path for static directory, relative to current file location
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -15,6 +35,12 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 # Include the addresses router (this router should provide /api/plots and /api/addresses/{code})
 app.include_router(addresses.router, prefix="/api")
+app.include_router(tiles.router, prefix="/api")
+app.include_router(changes.router, prefix="/api")
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
 
 @app.get("/", response_class=HTMLResponse)
 async def index():
@@ -0,0 +1,74 @@
+# synth_kml.py
+# Synthetic OmanReal-style KML for benchmarks: nested Folders of Placemarks
+# with a name, description, ExtendedData and one polygon plot each.
+import os
+import math
+import random
+import argparse
+
+# Mainland Oman, roughly
+OMAN_BBOX = (52.0, 16.6, 59.8, 26.4)
+PLOT_SIZE_DEG = 0.0003  # ~30 m
+
+def plot_ring(rng, cx, cy, vertices):
+    """Closed, slightly irregular ring of `vertices` points around (cx, cy)."""
+    coords = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        r = PLOT_SIZE_DEG / 2 * rng.uniform(0.8, 1.0)
+        coords.append((cx + r * math.cos(angle), cy + r * math.sin(angle)))
+    coords.append(coords[0])
+    return " ".join(f"{x:.7f},{y:.7f},0" for x, y in coords)
+
+def placemark(rng, idx, vertices, extdata):
+    cx = rng.uniform(OMAN_BBOX[0], OMAN_BBOX[2])
+    cy = rng.uniform(OMAN_BBOX[1], OMAN_BBOX[3])
+    data = "".join(
+        f'<Data name="field_{k}"><value>{rng.randrange(10 ** 6)}</value></Data>' for k in range(extdata)
+    )
+    return (
+        f"<Placemark><name>Plot {idx}</name>"
+        f"<description>Synthetic plot {idx}</description>"
+        f'<ExtendedData><Data name="plot_no"><value>{idx}</value></Data>{data}</ExtendedData>'
+        f"<Polygon><outerBoundaryIs><LinearRing><coordinates>{plot_ring(rng, cx, cy, vertices)}"
+        f"</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark>\n"
+    )
+
+def write_kml(path, placemarks, vertices=8, extdata=5, depth=1, seed=0, start=0):
+    """Write one KML file. Placemarks are spread over `depth` levels of nested Folders."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n')
+        f.write(f"<name>{os.path.basename(path)}</name>\n")
+        for level in range(depth):
+            f.write(f"<Folder><name>Level {level}</name>\n")
+        for i in range(placemarks):
+            f.write(placemark(rng, start + i, vertices, extdata))
+        f.write("</Folder>\n" * depth)
+        f.write("</Document></kml>\n")
+    return path
+
+def generate(outdir, files=1, placemarks=10000, vertices=8, extdata=5, depth=1, seed=0):
+    """Write `files` KML files of `placemarks` each into outdir. Returns their paths."""
+    os.makedirs(outdir, exist_ok=True)
+    return [
+        write_kml(os.path.join(outdir, f"synthetic_{n:04d}.kml"), placemarks, vertices, extdata, depth,
+                  seed=seed + n, start=n * placemarks)
+        for n in range(files)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic OmanReal-style KML files")
+    parser.add_argument("outdir")
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--placemarks", type=int, default=10000, help="placemarks per file")
+    parser.add_argument("--vertices", type=int, default=8, help="polygon vertices per plot")
+    parser.add_argument("--extdata", type=int, default=5, help="extra ExtendedData fields per placemark")
+    parser.add_argument("--depth", type=int, default=1, help="nested Folder levels")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for path in generate(args.outdir, args.files, args.placemarks, args.vertices, args.extdata, args.depth, args.seed):
+        print(path)
+
+if __name__ == "__main__":
+    main()
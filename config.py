@@ -0,0 +1,64 @@
+# config.py
+import os
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgresql://postgres:postgres@db:5432/omanpostadd")
+
+# Ingestion: coordinates are snapped to this grid in degrees (1e-7 ~ 1 cm); 0 keeps full precision
+GEOMETRY_GRID_SIZE = float(os.environ.get("GEOMETRY_GRID_SIZE", 1e-7))
+
+# Vector tiles (/api/tiles/{z}/{x}/{y}.mvt)
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+TILE_MIN_ZOOM = int(os.environ.get("TILE_MIN_ZOOM", 12))  # below it tiles carry address_clusters points
+TILE_MAX_FEATURES = int(os.environ.get("TILE_MAX_FEATURES", 20000))
+TILE_CACHE_MAX_BYTES = int(os.environ.get("TILE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+TILE_CACHE_DIR = os.environ.get("TILE_CACHE_DIR", "")  # empty disables the disk layer
+TILE_DISK_CACHE_MAX_TILES = int(os.environ.get("TILE_DISK_CACHE_MAX_TILES", 200000))
+TILE_INVALIDATION_POLL = float(os.environ.get("TILE_INVALIDATION_POLL", 5.0))  # seconds
+
+# /api/plots GeoJSON
+GEOJSON_PRECISION = int(os.environ.get("GEOJSON_PRECISION", 7))  # decimal places, 7 ~ 1 cm
+PLOTS_PAGE_LIMIT = int(os.environ.get("PLOTS_PAGE_LIMIT", 1000))
+PLOTS_MAX_LIMIT = int(os.environ.get("PLOTS_MAX_LIMIT", 10000))
+PLOTS_STREAM_BATCH = int(os.environ.get("PLOTS_STREAM_BATCH", 2000))
+
+# /api/reverse
+REVERSE_INDEX_ENABLED = os.environ.get("REVERSE_INDEX_ENABLED", "1") == "1"
+REVERSE_REFRESH_SECONDS = float(os.environ.get("REVERSE_REFRESH_SECONDS", 30.0))
+REVERSE_MAX_DISTANCE_M = float(os.environ.get("REVERSE_MAX_DISTANCE_M", 200.0))
+REVERSE_LOAD_BATCH = int(os.environ.get("REVERSE_LOAD_BATCH", 50000))
+
+# POST /api/addresses/batch, /api/reverse/batch
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 10000))
+
+# API database pool (async engine for request handlers, sync engine for background loaders)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10.0))  # seconds waiting for a free connection
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))  # seconds
+# Sync engine: reverse index loader and scripts, a couple of connections per worker
+SYNC_DB_POOL_SIZE = int(os.environ.get("SYNC_DB_POOL_SIZE", 2))
+SYNC_DB_MAX_OVERFLOW = int(os.environ.get("SYNC_DB_MAX_OVERFLOW", 2))
+DB_COMMAND_TIMEOUT = float(os.environ.get("DB_COMMAND_TIMEOUT", 30.0))  # seconds per query
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 500))  # 0 behind pgbouncer
+
+# Rendered /api/addresses/{code} and /api/plots pages, keyed by request
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# /api/plots/clusters
+CLUSTER_MAX_FEATURES = int(os.environ.get("CLUSTER_MAX_FEATURES", 500))
+
+# /api/search
+SEARCH_PAGE_LIMIT = int(os.environ.get("SEARCH_PAGE_LIMIT", 20))
+SEARCH_MAX_LIMIT = int(os.environ.get("SEARCH_MAX_LIMIT", 100))
+SEARCH_MIN_CHARS = int(os.environ.get("SEARCH_MIN_CHARS", 3))  # shorter queries would match most plots
+SEARCH_SIMILARITY = float(os.environ.get("SEARCH_SIMILARITY", 0.5))  # pg_trgm word_similarity threshold
+
+# /api/changes
+CHANGES_PAGE_LIMIT = int(os.environ.get("CHANGES_PAGE_LIMIT", 1000))
+CHANGES_MAX_LIMIT = int(os.environ.get("CHANGES_MAX_LIMIT", 10000))
+
+# /metrics and slow-request diagnostics
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", 1.0))  # logged, and profiled if sampled
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")  # empty disables request profiling
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.01))  # fraction of requests under cProfile
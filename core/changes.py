@@ -0,0 +1,81 @@
+# changes.py
+# Region change log. Writers (ingestion, address generation) append the bbox
+# they touched; the API polls it to drop cached tiles/responses for that area.
+
+def ensure_changes_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS region_changes (
+            version bigserial PRIMARY KEY,
+            bbox geometry(Geometry,4326),
+            changed_at timestamptz DEFAULT now()
+        );
+    """)
+
+def record_change(cur, bbox=None):
+    """Log a change covering bbox (minx, miny, maxx, maxy). None means everywhere."""
+    if bbox is None:
+        cur.execute("INSERT INTO region_changes (bbox) VALUES (NULL) RETURNING version")
+    else:
+        cur.execute("""
+            INSERT INTO region_changes (bbox)
+            VALUES (ST_MakeEnvelope(%s, %s, %s, %s, 4326))
+            RETURNING version
+        """, tuple(bbox))
+    return cur.fetchone()[0]
+
+def merge_bounds(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def track_plot_changes(cur):
+    """raw_plots.updated_at: bumped when a plot's content changes or it is (un)tombstoned."""
+    cur.execute("""
+        ALTER TABLE raw_plots ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+        CREATE INDEX IF NOT EXISTS raw_plots_updated_at_idx ON raw_plots (updated_at);
+        CREATE OR REPLACE FUNCTION raw_plots_touch() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.updated_at := now();
+            RETURN NEW;
+        END $$;
+        DROP TRIGGER IF EXISTS raw_plots_touch ON raw_plots;
+        CREATE TRIGGER raw_plots_touch BEFORE UPDATE ON raw_plots FOR EACH ROW
+        WHEN (OLD.content_hash IS DISTINCT FROM NEW.content_hash OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at)
+        EXECUTE FUNCTION raw_plots_touch();
+    """)
+
+# Address change feed (/api/changes). Every insert or relevant update stamps
+# the row with the writing transaction's id; a reader only returns rows whose
+# transaction is older than every transaction still running, so a token never
+# skips a change that commits late.
+def track_address_changes(cur):
+    cur.execute("""
+        ALTER TABLE addresses ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+        ALTER TABLE addresses ADD COLUMN IF NOT EXISTS deleted_at timestamptz;
+        ALTER TABLE addresses ADD COLUMN IF NOT EXISTS change_xid BIGINT NOT NULL DEFAULT 0;
+        CREATE INDEX IF NOT EXISTS addresses_change_idx ON addresses (change_xid, address_id);
+        CREATE OR REPLACE FUNCTION addresses_touch() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.updated_at := now();
+            NEW.change_xid := pg_current_xact_id()::text::bigint;
+            RETURN NEW;
+        END $$;
+        DROP TRIGGER IF EXISTS addresses_touch ON addresses;
+        CREATE TRIGGER addresses_touch BEFORE INSERT OR UPDATE OF canonical_code, wilayat_code, geom, deleted_at
+        ON addresses FOR EACH ROW EXECUTE FUNCTION addresses_touch();
+
+        -- A re-ingested or tombstoned plot carries its address along; tiers are recomputed
+        CREATE OR REPLACE FUNCTION raw_plots_sync_address() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE addresses
+            SET geom = NEW.geom, deleted_at = NEW.deleted_at, label_point = NULL
+            WHERE raw_id = NEW.raw_id;
+            RETURN NULL;
+        END $$;
+        DROP TRIGGER IF EXISTS raw_plots_sync_address ON raw_plots;
+        CREATE TRIGGER raw_plots_sync_address AFTER UPDATE ON raw_plots FOR EACH ROW
+        WHEN (OLD.content_hash IS DISTINCT FROM NEW.content_hash OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at)
+        EXECUTE FUNCTION raw_plots_sync_address();
+    """)
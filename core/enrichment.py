@@ -0,0 +1,147 @@
+# enrichment.py
+import json
+import time
+import logging
+import argparse
+import psycopg2
+
+ENRICH_BATCH_SIZE = 50000
+SUBDIVIDE_VERTICES = 256
+
+def ensure_enrichment_columns(cur):
+    # enriched_at IS NULL marks plots still waiting for a wilayat lookup;
+    # ingestion resets it whenever a plot's geometry changes.
+    cur.execute("SELECT to_regclass('raw_plots') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return
+    cur.execute("""
+        ALTER TABLE raw_plots ADD COLUMN IF NOT EXISTS wilayat_code TEXT;
+        ALTER TABLE raw_plots ADD COLUMN IF NOT EXISTS enriched_at timestamptz;
+        CREATE INDEX IF NOT EXISTS raw_plots_unenriched_idx ON raw_plots (raw_id) WHERE enriched_at IS NULL;
+    """)
+
+def ensure_boundary_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS admin_boundaries (
+            wilayat_code TEXT PRIMARY KEY,
+            wilayat_name TEXT,
+            governorate TEXT,
+            geom geometry(MultiPolygon,4326)
+        );
+        CREATE TABLE IF NOT EXISTS admin_boundaries_sub (
+            wilayat_code TEXT,
+            geom geometry(Polygon,4326)
+        );
+        CREATE INDEX IF NOT EXISTS admin_boundaries_sub_geom_idx ON admin_boundaries_sub USING GIST(geom);
+    """)
+    ensure_enrichment_columns(cur)
+
+def load_boundaries(conn, path, code_field="wilayat_code", name_field="wilayat_name",
+                    governorate_field="governorate"):
+    """Replace admin_boundaries with the polygons of a GeoJSON FeatureCollection.
+
+    Wilayat polygons are also cut into small pieces (admin_boundaries_sub) so
+    point-in-polygon tests only touch a few hundred vertices. Every plot is
+    queued for re-enrichment afterwards; create_addresses then moves
+    addresses whose wilayat changed (address_gen.reassign_addresses).
+    """
+    with open(path, encoding="utf-8") as f:
+        collection = json.load(f)
+    rows = []
+    for feature in collection.get("features", []):
+        props = feature.get("properties") or {}
+        if not feature.get("geometry") or not props.get(code_field):
+            continue
+        rows.append((str(props[code_field]), props.get(name_field), props.get(governorate_field),
+                     json.dumps(feature["geometry"])))
+    with conn.cursor() as cur:
+        ensure_boundary_tables(cur)
+        cur.execute("TRUNCATE admin_boundaries, admin_boundaries_sub")
+        cur.executemany("""
+            INSERT INTO admin_boundaries (wilayat_code, wilayat_name, governorate, geom)
+            VALUES (%s, %s, %s,
+                    ST_Multi(ST_CollectionExtract(ST_MakeValid(ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326)), 3)))
+            ON CONFLICT (wilayat_code) DO UPDATE
+            SET geom = ST_Multi(ST_Union(admin_boundaries.geom, EXCLUDED.geom))
+        """, rows)
+        cur.execute("""
+            INSERT INTO admin_boundaries_sub (wilayat_code, geom)
+            SELECT wilayat_code, ST_Subdivide(geom, %s) FROM admin_boundaries
+        """, (SUBDIVIDE_VERTICES,))
+        cur.execute("ANALYZE admin_boundaries_sub")
+        cur.execute("SELECT to_regclass('raw_plots') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("UPDATE raw_plots SET enriched_at = NULL WHERE enriched_at IS NOT NULL")
+    conn.commit()
+    logging.info(f"Loaded {len(rows)} wilayat boundaries from {path}")
+    return len(rows)
+
+# Point-on-surface always lies inside the plot, so a plot straddling a border
+# lands in exactly one wilayat. Plots outside every boundary keep a NULL code.
+ASSIGN_BATCH_SQL = """
+    WITH todo AS (
+        SELECT raw_id, geom
+        FROM raw_plots
+        WHERE enriched_at IS NULL
+        LIMIT %(batch)s
+        FOR UPDATE SKIP LOCKED
+    ),
+    matched AS (
+        SELECT t.raw_id,
+               (SELECT s.wilayat_code
+                FROM admin_boundaries_sub s
+                WHERE ST_Intersects(s.geom, ST_PointOnSurface(t.geom))
+                LIMIT 1) AS wilayat_code
+        FROM todo t
+    )
+    UPDATE raw_plots r
+    SET wilayat_code = m.wilayat_code, enriched_at = now()
+    FROM matched m
+    WHERE r.raw_id = m.raw_id
+"""
+
+def assign_wilayats(conn, batch_size=ENRICH_BATCH_SIZE):
+    """Assign wilayat codes to every plot not enriched yet. Returns the number of plots looked up."""
+    started = time.perf_counter()
+    total = 0
+    with conn.cursor() as cur:
+        ensure_boundary_tables(cur)
+        conn.commit()
+        while True:
+            cur.execute(ASSIGN_BATCH_SQL, {"batch": batch_size})
+            count = cur.rowcount
+            conn.commit()
+            if count <= 0:
+                break
+            total += count
+    elapsed = time.perf_counter() - started
+    if total:
+        logging.info(f"Assigned wilayats to {total} plots in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)")
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Admin boundary enrichment for raw plots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    load = sub.add_parser("load-boundaries", help="load wilayat polygons from a GeoJSON file")
+    load.add_argument("path")
+    load.add_argument("dsn")
+    load.add_argument("--code-field", default="wilayat_code")
+    load.add_argument("--name-field", default="wilayat_name")
+    load.add_argument("--governorate-field", default="governorate")
+    assign = sub.add_parser("assign", help="assign wilayat codes to new plots")
+    assign.add_argument("dsn")
+    assign.add_argument("--batch-size", type=int, default=ENRICH_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        if args.command == "load-boundaries":
+            load_boundaries(conn, args.path, args.code_field, args.name_field, args.governorate_field)
+        else:
+            assign_wilayats(conn, args.batch_size)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Text, JSON, DateTime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from geoalchemy2 import Geometry
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -9,14 +9,22 @@ Base = declarative_base()
 
 class RawPlot(Base):
     __tablename__ = "raw_plots"
+    # LIST-partitioned by source (ingestion/partitions.py), hence the composite key
+    __table_args__ = (UniqueConstraint("source", "source_id", name="raw_plots_source_key"),)
 
     raw_id = Column(UUID(as_uuid=True), primary_key=True)
-    source = Column(Text)
+    source = Column(Text, primary_key=True)
+    source_file = Column(Text)
     source_id = Column(Text)
-    payload = Column(JSON)
+    payload = Column(JSONB)
+    search_text = Column(Text)
     geom = Column(Geometry(geometry_type='GEOMETRY', srid=4326))
-    footprint = Column(Geometry(geometry_type='GEOMETRY', srid=4326))
     fetched_at = Column(DateTime, default=datetime.utcnow)
+    content_hash = Column(Text)
+    deleted_at = Column(DateTime)
+    wilayat_code = Column(Text)
+    enriched_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 class Address(Base):
     __tablename__ = "addresses"
@@ -26,4 +34,10 @@ class Address(Base):
     wilayat_code = Column(String)
     canonical_code = Column(String)
     geom = Column(Geometry(geometry_type='GEOMETRY', srid=4326))
+    label_point = Column(Geometry(geometry_type='POINT', srid=4326))
+    geom_z12 = Column(Geometry(geometry_type='GEOMETRY', srid=4326))
+    geom_z15 = Column(Geometry(geometry_type='GEOMETRY', srid=4326))
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    deleted_at = Column(DateTime)
+    change_xid = Column(BigInteger, nullable=False, default=0)
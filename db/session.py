@@ -1,17 +1,43 @@
 # session.py
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from contextlib import contextmanager
+import config
 
-DATABASE_URL = "postgresql://postgres:postgres@db:5432/omanpostadd"
+DATABASE_URL = config.DATABASE_URL
 
-engine = create_engine(DATABASE_URL)
+POOL_OPTIONS = dict(
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_recycle=config.DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+)
+
+# Request handlers: asyncpg, so a slow query parks a coroutine instead of a thread
+async_engine = create_async_engine(
+    make_url(DATABASE_URL).set(
+        drivername="postgresql+asyncpg",
+        query={"prepared_statement_cache_size": str(config.DB_STATEMENT_CACHE_SIZE)},
+    ),
+    connect_args={
+        "command_timeout": config.DB_COMMAND_TIMEOUT,
+        "statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+    },
+    **POOL_OPTIONS,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Background work (reverse index loader) and scripts stay on the sync driver
+engine = create_engine(
+    make_url(DATABASE_URL).set(drivername="postgresql+psycopg2"),
+    pool_size=2,
+    max_overflow=2,
+    pool_pre_ping=True,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-@contextmanager
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
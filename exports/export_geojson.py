@@ -0,0 +1,40 @@
+# export_geojson.py
+from exports.stream import main
+import config
+
+class GeoJSONWriter:
+    """FeatureCollection of addresses; features are serialized by PostGIS.
+
+    Properties are the raw plot's KML properties plus code and wilayat_code.
+    """
+    extension = "geojson"
+    media_type = "application/geo+json"
+    columns = """
+        json_build_object(
+            'type', 'Feature',
+            'id', a.canonical_code,
+            'geometry', ST_AsGeoJSON(a.geom, :precision)::json,
+            'properties', coalesce(r.payload, '{}'::jsonb)
+                          || jsonb_build_object('code', a.canonical_code, 'wilayat_code', a.wilayat_code)
+        )::text
+    """
+
+    def __init__(self, precision=config.GEOJSON_PRECISION):
+        self.params = {"precision": precision}
+        self.count = 0
+        self._sep = ""
+
+    def header(self):
+        return '{"type":"FeatureCollection","features":[\n'
+
+    def rows(self, rows):
+        chunk = self._sep + ",\n".join(row[0] for row in rows)
+        self._sep = ",\n"
+        self.count += len(rows)
+        return chunk
+
+    def footer(self):
+        return "\n]}\n"
+
+if __name__ == "__main__":
+    main(GeoJSONWriter)
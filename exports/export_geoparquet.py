@@ -0,0 +1,65 @@
+# export_geoparquet.py
+import json
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from exports.columnar import COLUMNS, SCHEMA, main
+
+ROW_GROUP_SIZE = 65536
+
+class GeoParquetWriter:
+    """GeoParquet 1.1: WKB geometry plus a bbox covering column.
+
+    Rows are ordered along a geohash (Z-order) curve, so each row group covers
+    a compact area and its bbox min/max statistics let readers skip the rest.
+    """
+    extension = "parquet"
+    columns = COLUMNS
+    order_by = "ST_GeoHash(ST_Centroid(a.geom), 12)"
+
+    def __init__(self, row_group_size=ROW_GROUP_SIZE, compression="zstd"):
+        self.params = {}
+        self.row_group_size = row_group_size
+        self.compression = compression
+
+    def write(self, path, batches):
+        count = 0
+        extent = None
+        pending, pending_rows = [], 0
+        with pq.ParquetWriter(path, SCHEMA, compression=self.compression) as out:
+            for batch in batches:
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                if pending_rows >= self.row_group_size:
+                    extent = self._flush(out, pending, extent)
+                    count += pending_rows
+                    pending, pending_rows = [], 0
+            if pending:
+                extent = self._flush(out, pending, extent)
+                count += pending_rows
+            out.add_key_value_metadata({"geo": json.dumps(geo_metadata(extent))})
+        return count
+
+    def _flush(self, out, batches, extent):
+        table = pa.Table.from_batches(batches, SCHEMA)
+        out.write_table(table, row_group_size=self.row_group_size)
+        bbox = table.column("bbox").combine_chunks()
+        group = [pc.min(bbox.field("xmin")).as_py(), pc.min(bbox.field("ymin")).as_py(),
+                 pc.max(bbox.field("xmax")).as_py(), pc.max(bbox.field("ymax")).as_py()]
+        if extent is None:
+            return group
+        return [min(extent[0], group[0]), min(extent[1], group[1]),
+                max(extent[2], group[2]), max(extent[3], group[3])]
+
+def geo_metadata(extent):
+    column = {
+        "encoding": "WKB",
+        "geometry_types": [],
+        "covering": {"bbox": {k: ["bbox", k] for k in ("xmin", "ymin", "xmax", "ymax")}},
+    }
+    if extent is not None:
+        column["bbox"] = extent
+    return {"version": "1.1.0", "primary_column": "geometry", "columns": {"geometry": column}}
+
+if __name__ == "__main__":
+    main(GeoParquetWriter)
@@ -0,0 +1,45 @@
+# export_kml.py
+from exports.stream import main
+import config
+
+class KMLWriter:
+    """KML Document with one Placemark per address, built (and escaped) by PostgreSQL.
+
+    The canonical code is the Placemark name; wilayat_code and the raw plot's
+    properties go to ExtendedData.
+    """
+    extension = "kml"
+    media_type = "application/vnd.google-earth.kml+xml"
+    columns = """
+        xmlelement(name "Placemark",
+            xmlelement(name "name", a.canonical_code),
+            xmlelement(name "ExtendedData",
+                xmlelement(name "Data", xmlattributes('wilayat_code' AS name),
+                           xmlelement(name "value", a.wilayat_code)),
+                (SELECT xmlagg(xmlelement(name "Data", xmlattributes(p.key AS name),
+                                          xmlelement(name "value", p.value)))
+                 FROM jsonb_each_text(r.payload) p)
+            ),
+            ST_AsKML(a.geom, :precision)::xml
+        )::text
+    """
+
+    def __init__(self, precision=config.GEOJSON_PRECISION, name="omanpostadd"):
+        self.params = {"precision": precision}
+        self.name = name
+        self.count = 0
+
+    def header(self):
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>'
+                f'<name>{self.name}</name>\n')
+
+    def rows(self, rows):
+        self.count += len(rows)
+        return "\n".join(row[0] for row in rows) + "\n"
+
+    def footer(self):
+        return "</Document></kml>\n"
+
+if __name__ == "__main__":
+    main(KMLWriter)
@@ -1,10 +1,20 @@
 # parse_kml.py
 import os
 import glob
+import logging
+import argparse
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from fastkml import kml
-from shapely.geometry import mapping
+from shapely.geometry import (
+    mapping, Point, LineString, LinearRing, Polygon,
+    MultiPoint, MultiLineString, MultiPolygon, GeometryCollection,
+)
 from shapely.wkt import dumps as wkt_dumps
 
+GEOMETRY_TAGS = {"Point", "LineString", "LinearRing", "Polygon", "MultiGeometry"}
+
 def parse_kml_file(filepath):
     with open(filepath, "rb") as f:
         data = f.read()
@@ -47,26 +57,160 @@ def placemark_to_dict(pm):
         "geometry_wkt": geom_wkt
     }
 
-def parse_dir(kml_dir):
+# Streaming parser: yields one placemark at a time and frees it afterwards,
+# so memory stays flat regardless of file size.
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def _child(elem, name):
+    if elem is None:
+        return None
+    for c in elem:
+        if _local(c.tag) == name:
+            return c
+    return None
+
+def _coords(elem):
+    text = elem.text if elem is not None else None
+    if not text:
+        return []
+    return [tuple(float(v) for v in tok.split(",")) for tok in text.split()]
+
+def _rings(boundary):
+    return [_coords(_child(ring, "coordinates")) for ring in boundary if _local(ring.tag) == "LinearRing"]
+
+def _geometry(elem):
+    kind = _local(elem.tag)
+    if kind == "Point":
+        coords = _coords(_child(elem, "coordinates"))
+        return Point(coords[0]) if coords else None
+    if kind == "LineString":
+        return LineString(_coords(_child(elem, "coordinates")))
+    if kind == "LinearRing":
+        return LinearRing(_coords(_child(elem, "coordinates")))
+    if kind == "Polygon":
+        shell = []
+        holes = []
+        for boundary in elem:
+            name = _local(boundary.tag)
+            if name == "outerBoundaryIs":
+                shell = (_rings(boundary) or [[]])[0]
+            elif name == "innerBoundaryIs":
+                holes.extend(_rings(boundary))
+        return Polygon(shell, holes)
+    if kind == "MultiGeometry":
+        parts = [_geometry(c) for c in elem if _local(c.tag) in GEOMETRY_TAGS]
+        parts = [p for p in parts if p is not None]
+        types = {p.geom_type for p in parts}
+        if types == {"Point"}:
+            return MultiPoint(parts)
+        if types <= {"LineString", "LinearRing"} and types:
+            return MultiLineString(parts)
+        if types == {"Polygon"}:
+            return MultiPolygon(parts)
+        return GeometryCollection(parts)
+    return None
+
+def _placemark_record(elem):
+    props = {}
+    geom = None
+    for c in elem:
+        name = _local(c.tag)
+        if name in ("name", "description") and c.text:
+            props[name] = c.text
+        elif name == "ExtendedData":
+            for data in c.iter():
+                data_tag = _local(data.tag)
+                if data_tag == "Data":
+                    value = _child(data, "value")
+                    props[data.get("name")] = value.text if value is not None else None
+                elif data_tag == "SimpleData":
+                    props[data.get("name")] = data.text
+        elif name in GEOMETRY_TAGS and geom is None:
+            geom = _geometry(c)
+    return props, geom
+
+def iter_placemarks(filepath):
+    """Yield (KML id or None, properties, shapely geometry) per placemark."""
+    stack = []
+    for event, elem in ET.iterparse(filepath, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if _local(elem.tag) != "Placemark":
+            continue
+        yield (elem.get("id"), *_placemark_record(elem))
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+def iter_placemark_records(filepath):
+    """Yield (properties, shapely geometry) per placemark, matching placemark_to_record."""
+    for _, props, geom in iter_placemarks(filepath):
+        yield props, geom
+
+def iter_placemark_dicts(filepath):
+    """Streaming counterpart of parse_kml_file + placemark_to_dict."""
+    for props, geom in iter_placemark_records(filepath):
+        yield {
+            "properties": props,
+            "geometry_wkt": wkt_dumps(geom) if geom is not None else None,
+        }
+
+def parse_file_dicts(path):
+    """Worker process: all placemark dicts of one file, or the error that stopped it."""
     results = []
-    for path in glob.glob(os.path.join(kml_dir, "*.kml")):
+    try:
+        for i, d in enumerate(iter_placemark_dicts(path)):
+            d["source_file"] = os.path.basename(path)
+            d["source_index"] = i
+            results.append(d)
+    except Exception as e:
+        return results, str(e)
+    return results, None
+
+def iter_dir(kml_dir, workers=1):
+    paths = glob.glob(os.path.join(kml_dir, "*.kml"))
+    if workers > 1:
+        # At most `workers` files in flight; the next is submitted only once
+        # the consumer has taken a finished file, so memory stays bounded
+        todo = deque(paths)
+        pending = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while todo or pending:
+                while todo and len(pending) < workers:
+                    path = todo.popleft()
+                    pending[pool.submit(parse_file_dicts, path)] = path
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = pending.pop(future)
+                    results, error = future.result()
+                    if error:
+                        logging.error(f"Error parsing {path}: {error}")
+                    yield from results
+        return
+    for path in paths:
         try:
-            pms = parse_kml_file(path)
-            for i, pm in enumerate(pms):
-                d = placemark_to_dict(pm)
+            for i, d in enumerate(iter_placemark_dicts(path)):
                 d["source_file"] = os.path.basename(path)
                 d["source_index"] = i
-                results.append(d)
+                yield d
         except Exception as e:
-            print(f"[ERROR] parsing {path}: {e}")
-    return results
+            logging.error(f"Error parsing {path}: {e}")
+
+def parse_dir(kml_dir, workers=1):
+    return list(iter_dir(kml_dir, workers))
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python parse_kml.py kml_directory")
-        exit(1)
-    parsed = parse_dir(sys.argv[1])
-    print(f"Parsed {len(parsed)} placemarks.")
-    for p in parsed[:5]:
-        print(p)
+    parser = argparse.ArgumentParser(description="Parse KML files and print a sample of placemarks")
+    parser.add_argument("kml_dir", help="directory of *.kml files")
+    parser.add_argument("--workers", type=int, default=1, help="parser processes")
+    args = parser.parse_args()
+    count = 0
+    for p in iter_dir(args.kml_dir, args.workers):
+        if count < 5:
+            print(p)
+        count += 1
+    print(f"Parsed {count} placemarks.")
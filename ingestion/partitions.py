@@ -0,0 +1,180 @@
+# partitions.py
+# raw_plots is LIST-partitioned by source: every source (one crawl or import
+# lineage) gets its own table, so retiring one is a DROP TABLE instead of a
+# DELETE that leaves the heap and every index to vacuum. Rows of sources
+# without a partition land in raw_plots_default. Partitions are found by their
+# bound, not their name, which only has to be unique.
+#
+# Drop granularity is the source, nothing finer: today everything is loaded
+# as the single source omanreal_kml, so all rows share one partition and no
+# part of it can be dropped on its own. Ingest batches are not a usable key,
+# because loads update plots in place (source, source_id) across runs and a
+# re-ingested row would have to move partition every time.
+import re
+import hashlib
+import logging
+import argparse
+import psycopg2
+from psycopg2 import sql
+from core.changes import ensure_changes_table, record_change, track_address_changes
+
+LEGACY_TABLE = "raw_plots_legacy"
+
+def partition_name(source):
+    """Table name for a new partition; the hash keeps sources that slug alike (and "default") apart."""
+    slug = (re.sub(r"[^a-z0-9]+", "_", source.lower()).strip("_") or "unnamed")[:40]
+    return f"raw_plots_{slug}_{hashlib.sha1(source.encode()).hexdigest()[:8]}"
+
+def find_partition(cur, source):
+    """Name of the partition bound to exactly source, or None if its rows go to the default partition."""
+    # pg_get_expr deparses the bound as FOR VALUES IN ('...') with quotes doubled
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'raw_plots'::regclass
+          AND pg_get_expr(c.relpartbound, c.oid) = 'FOR VALUES IN (''' || replace(%s, '''', '''''') || ''')'
+    """, (source,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def create_raw_plots(cur):
+    """The partitioned parent with every column, and the default partition."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS raw_plots (
+            raw_id uuid NOT NULL DEFAULT uuid_generate_v4(),
+            source TEXT NOT NULL,
+            source_file TEXT,
+            source_id TEXT,
+            payload JSONB,
+            search_text TEXT,
+            geom geometry(Geometry,4326),
+            content_hash TEXT,
+            fetched_at timestamptz DEFAULT now(),
+            updated_at timestamptz DEFAULT now(),
+            deleted_at timestamptz,
+            wilayat_code TEXT,
+            enriched_at timestamptz,
+            CONSTRAINT raw_plots_pkey PRIMARY KEY (raw_id, source),
+            CONSTRAINT raw_plots_source_key UNIQUE (source, source_id)
+        ) PARTITION BY LIST (source);
+        CREATE TABLE IF NOT EXISTS raw_plots_default PARTITION OF raw_plots DEFAULT;
+    """)
+
+def ensure_source_partition(cur, source):
+    name = find_partition(cur, source)
+    if name is None:
+        name = partition_name(source)
+        cur.execute(sql.SQL("CREATE TABLE {} PARTITION OF raw_plots FOR VALUES IN ({})").format(
+            sql.Identifier(name), sql.Literal(source)))
+        logging.info(f"Created partition {name} for source {source!r}")
+    return name
+
+def partition_raw_plots(cur):
+    """One-off: move a plain raw_plots heap into the partitioned layout.
+
+    Rows are copied once, which also drops the footprint column (a second copy
+    of geom) and rewrites the table without dead tuples. Indexes are built by
+    the callers' ensure steps afterwards, on the partitions.
+    """
+    cur.execute(f"""
+        ALTER TABLE raw_plots RENAME TO {LEGACY_TABLE};
+        ALTER INDEX IF EXISTS raw_plots_pkey RENAME TO {LEGACY_TABLE}_pkey;
+        ALTER INDEX IF EXISTS raw_plots_source_key RENAME TO {LEGACY_TABLE}_source_key;
+    """)
+    create_raw_plots(cur)
+    cur.execute(f"SELECT DISTINCT source FROM {LEGACY_TABLE} WHERE source IS NOT NULL")
+    for (source,) in cur.fetchall():
+        ensure_source_partition(cur, source)
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns WHERE table_name = %s
+        INTERSECT
+        SELECT column_name FROM information_schema.columns WHERE table_name = 'raw_plots'
+    """, (LEGACY_TABLE,))
+    columns = [c for (c,) in cur.fetchall() if c != "source"]
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    cur.execute(sql.SQL("""
+        INSERT INTO raw_plots (source, {columns})
+        SELECT coalesce(source, 'unknown'), {columns} FROM {legacy}
+    """).format(columns=column_list, legacy=sql.Identifier(LEGACY_TABLE)))
+    logging.info(f"Moved {cur.rowcount} plots into partitioned raw_plots")
+    cur.execute(f"DROP TABLE {LEGACY_TABLE}")
+    # Dropped with the old table; the plot -> address sync trigger lives on raw_plots
+    cur.execute("SELECT to_regclass('addresses') IS NOT NULL")
+    if cur.fetchone()[0]:
+        track_address_changes(cur)
+
+def list_partitions(conn):
+    """(partition, bound, rows estimate, total bytes) for every raw_plots partition."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint,
+                   pg_total_relation_size(c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'raw_plots'::regclass
+            ORDER BY c.relname
+        """)
+        return cur.fetchall()
+
+def drop_source(conn, source):
+    """Retire every plot of source: tombstone their addresses, then drop the partition. Returns addresses tombstoned."""
+    with conn.cursor() as cur:
+        # Never the default partition: it holds every source without its own
+        partition = find_partition(cur, source)
+        if partition is None:
+            raise ValueError(f"No partition for source {source!r}")
+        name = sql.Identifier(partition)
+        gone = 0
+        cur.execute("SELECT to_regclass('addresses') IS NOT NULL")
+        if cur.fetchone()[0]:
+            ensure_changes_table(cur)
+            cur.execute(sql.SQL("""
+                WITH gone AS (
+                    UPDATE addresses a SET deleted_at = now()
+                    FROM {} r
+                    WHERE a.raw_id = r.raw_id AND a.deleted_at IS NULL
+                    RETURNING a.geom
+                )
+                SELECT n, ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+                FROM (SELECT count(*) AS n, ST_Extent(geom) AS e FROM gone) s
+            """).format(name))
+            gone, *bbox = cur.fetchone()
+            if gone:
+                record_change(cur, tuple(bbox))
+        for table, condition in (("plot_matches", "raw_id_a IN ({ids}) OR raw_id_b IN ({ids})"),
+                                 ("plot_clusters", "raw_id IN ({ids})")):
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+            if cur.fetchone()[0]:
+                ids = sql.SQL("SELECT raw_id FROM {}").format(name)
+                cur.execute(sql.SQL("DELETE FROM {table} WHERE " + condition).format(table=sql.Identifier(table), ids=ids))
+        cur.execute(sql.SQL("ALTER TABLE raw_plots DETACH PARTITION {}").format(name))
+        cur.execute(sql.SQL("DROP TABLE {}").format(name))
+        cur.execute("DELETE FROM ingest_manifest WHERE source = %s", (source,))
+    conn.commit()
+    logging.info(f"Dropped source {source!r}: {gone} addresses tombstoned")
+    return gone
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and retire raw_plots source partitions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("list", help="partitions with row estimates and sizes")
+    show.add_argument("dsn")
+    drop = sub.add_parser("drop", help="drop every plot of a source and tombstone their addresses")
+    drop.add_argument("dsn")
+    drop.add_argument("source")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        if args.command == "list":
+            for relname, bound, rows, size in list_partitions(conn):
+                print(f"{relname}\t{bound}\t~{rows} rows\t{size / 2 ** 20:.1f} MiB")
+        else:
+            drop_source(conn, args.source)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
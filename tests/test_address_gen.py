@@ -0,0 +1,57 @@
+import os
+import psycopg2
+import pytest
+from core.address_gen import DEFAULT_WILAYAT, migrate_codes
+
+DSN = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DSN, reason="set TEST_DATABASE_URL to a scratch PostGIS database")
+
+@pytest.fixture
+def conn():
+    conn = psycopg2.connect(DSN)
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE SCHEMA address_gen_test;
+            SET search_path TO address_gen_test, public;
+            CREATE TABLE addresses (
+                address_id SERIAL PRIMARY KEY,
+                wilayat_code TEXT,
+                canonical_code TEXT
+            );
+            CREATE TABLE wilayat_counters (
+                wilayat_code TEXT PRIMARY KEY,
+                last_seq BIGINT NOT NULL DEFAULT 0
+            );
+            CREATE FUNCTION canonical_code(wilayat TEXT, seq BIGINT) RETURNS TEXT
+            LANGUAGE sql IMMUTABLE AS $$
+                SELECT 'OM-' || wilayat || '-' || lpad(seq::text, greatest(6, length(seq::text)), '0')
+            $$;
+        """)
+    conn.commit()
+    yield conn
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute("DROP SCHEMA address_gen_test CASCADE")
+    conn.commit()
+    conn.close()
+
+def test_migrate_codes_renumbers_every_collision(conn):
+    legacy = [
+        ("MCT01", "OM-MCT01-000001"), ("MCT01", "OM-MCT01-000001"), ("MCT01", "OM-MCT01-000007"),
+        (None, "OM-WL000-000001"), (None, "OM-WL000-000001"),  # no wilayat
+        (None, "LEGACY-A"), ("SIB02", "LEGACY-A"),  # no trailing number
+    ]
+    with conn.cursor() as cur:
+        cur.executemany("INSERT INTO addresses (wilayat_code, canonical_code) VALUES (%s, %s)", legacy)
+        migrate_codes(cur)
+        cur.execute("SELECT address_id, canonical_code FROM addresses ORDER BY address_id")
+        codes = dict(cur.fetchall())
+        cur.execute("SELECT wilayat_code, last_seq FROM wilayat_counters ORDER BY 1")
+        counters = dict(cur.fetchall())
+    conn.commit()
+    assert len(set(codes.values())) == len(legacy)
+    # The oldest address keeps its code, the others get fresh numbers
+    assert codes[1] == "OM-MCT01-000001" and codes[2] == "OM-MCT01-000008"
+    assert codes[4] == "OM-WL000-000001" and codes[5] == "OM-WL000-000002"
+    assert codes[6] == "LEGACY-A" and codes[7] == "OM-SIB02-000001"
+    assert counters == {"MCT01": 8, DEFAULT_WILAYAT: 2, "SIB02": 1}
@@ -0,0 +1,70 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from utils.geometry import parse_bbox
+
+client = TestClient(app)
+
+def test_parse_bbox():
+    assert parse_bbox("56.1,23.5,58.9,24.2") == (56.1, 23.5, 58.9, 24.2)
+    assert parse_bbox(" 56 , 23 , 57 , 24 ") == (56.0, 23.0, 57.0, 24.0)
+
+@pytest.mark.parametrize("value", [
+    "56,23,57",
+    "56,23,57,24,25",
+    "a,b,c,d",
+    "57,23,56,24",
+    "56,24,57,23",
+    "nan,23,57,24",
+    "56,23,inf,24",
+    "-inf,-inf,inf,inf",
+])
+def test_parse_bbox_rejects(value):
+    with pytest.raises(ValueError):
+        parse_bbox(value)
+
+@pytest.mark.parametrize("path", ["/api/plots", "/api/plots/clusters?zoom=5", "/api/export"])
+def test_bad_bbox_is_400(path):
+    sep = "&" if "?" in path else "?"
+    response = client.get(f"{path}{sep}bbox=56,23,nan,24")
+    assert response.status_code == 400
+
+def test_precondition_before_query():
+    from datetime import datetime, timezone
+    from email.utils import format_datetime
+    from starlette.requests import Request
+    from app.core.response_cache import ResponseCache, version_etag
+
+    def request(**headers):
+        raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+        return Request({"type": "http", "headers": raw})
+
+    cache = ResponseCache(1 << 20)
+    cache.version = 7
+    cache.changed_at = datetime(2026, 1, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+    key = ("address", "MCT-1")
+    etag = version_etag(7, key)
+    assert cache.put(key, b"{}", None, 7).etag == etag
+    assert cache.precondition(request(if_none_match=etag), key).status_code == 304
+    assert cache.precondition(request(if_none_match=version_etag(6, key)), key) is None
+    assert cache.precondition(request(if_none_match=version_etag(7, ("address", "MCT-2"))), key) is None
+    assert cache.precondition(request(if_modified_since=format_datetime(cache.changed_at, usegmt=True)), key).status_code == 304
+    assert cache.precondition(request(if_modified_since="Thu, 01 Jan 2026 11:59:59 GMT"), key) is None
+    assert cache.precondition(request(if_modified_since="garbage"), key) is None
+    # If-None-Match takes precedence over If-Modified-Since
+    stale = request(if_none_match=version_etag(6, key), if_modified_since="Fri, 02 Jan 2026 00:00:00 GMT")
+    assert cache.precondition(stale, key) is None
+
+def test_unpaged_plots_revalidate_without_querying(monkeypatch):
+    from app.api import addresses
+    from app.core.response_cache import version_etag
+
+    async def synced(db):
+        pass
+
+    monkeypatch.setattr(addresses.response_cache, "sync", synced)
+    monkeypatch.setattr(addresses.response_cache, "version", 42)
+    etag = version_etag(42, ("plots_stream", None, None, None, None))
+    response = client.get("/api/plots", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
@@ -0,0 +1,135 @@
+import io
+import time
+import asyncio
+import zipfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from ingestion import fetch_kml
+from ingestion.fetch_kml import AdaptiveLimiter, backoff, fetch_all, is_kml_url, local_filename
+
+KML = b'<?xml version="1.0"?><kml xmlns="http://www.opengis.net/kml/2.2"><Document/></kml>'
+
+def kmz(name="doc.kml"):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("files/icon.png", b"\x89PNG")
+        zf.writestr(name, KML)
+    return buf.getvalue()
+
+class Server:
+    """Local HTTP server; routes maps a path to a list of (status, headers, body), the last one repeating."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                server.requests.append((path, dict(self.headers)))
+                responses = server.routes[path]
+                status, headers, body = responses.pop(0) if len(responses) > 1 else responses[0]
+                if status == 200 and "ETag" in headers and self.headers.get("If-None-Match") == headers["ETag"]:
+                    status, body = 304, b""
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def test_local_filename_keeps_kml_suffix():
+    assert is_kml_url("https://maps.example/export.kml?token=abc")
+    assert is_kml_url("https://maps.example/export.KMZ")
+    assert not is_kml_url("https://maps.example/view?file=a.kml")
+    name = local_filename("https://maps.example/a/export.kml?token=abc")
+    assert name.startswith("maps.example_a_export_") and name.endswith(".kml")
+    assert local_filename("https://maps.example/a/export.kml?token=xyz") != name
+    assert local_filename("https://maps.example/a/export.kmz") == "maps.example_a_export.kml"
+
+def test_fetch_query_url_then_revalidate(tmp_path):
+    routes = {"/export.kml": [(200, {"ETag": '"v1"'}, KML)]}
+    with Server(routes) as server:
+        url = server.url + "/export.kml?token=abc"
+        assert asyncio.run(fetch_all([url], tmp_path))["fetched"] == 1
+        [path] = tmp_path.glob("*.kml")
+        assert path.read_bytes() == KML
+        assert asyncio.run(fetch_all([url], tmp_path, skip_fresh=0))["unchanged"] == 1
+        assert server.requests[-1][1].get("If-None-Match") == '"v1"'
+    assert list(tmp_path.glob("*.kml")) == [path]
+
+def test_fetch_unpacks_kmz(tmp_path):
+    routes = {"/plots.kmz": [(200, {}, kmz())]}
+    with Server(routes) as server:
+        assert asyncio.run(fetch_all([server.url + "/plots.kmz"], tmp_path))["fetched"] == 1
+    [path] = tmp_path.glob("*.kml")
+    assert path.read_bytes() == KML
+    assert not list(tmp_path.glob("*.part")) and not list(tmp_path.glob("*.unpacked"))
+
+def test_throttling_backs_off_and_halves_limit(tmp_path, monkeypatch, caplog):
+    caplog.set_level("INFO")
+    monkeypatch.setattr(fetch_kml, "BACKOFF_BASE", 0.01)
+    routes = {
+        "/busy.kml": [(503, {"Retry-After": "0"}, b""), (429, {}, b""), (200, {}, KML)],
+        "/gone.kml": [(500, {}, b"")],
+    }
+    with Server(routes) as server:
+        stats = asyncio.run(fetch_all([server.url + "/busy.kml", server.url + "/gone.kml"], tmp_path,
+                                      concurrency=8, max_concurrency=8))
+        busy = sum(1 for path, _ in server.requests if path == "/busy.kml")
+        gone = sum(1 for path, _ in server.requests if path == "/gone.kml")
+    assert stats["fetched"] == 1 and stats["failed"] == 1
+    assert busy == 3 and gone == fetch_kml.MAX_RETRIES
+    assert "concurrency now 4" in caplog.text
+
+def test_backoff():
+    assert backoff(0, "7") == 7.0
+    assert backoff(0, "9999") == fetch_kml.BACKOFF_MAX
+    assert fetch_kml.BACKOFF_BASE * 0.5 <= backoff(0, "soon") <= fetch_kml.BACKOFF_BASE * 1.5
+    assert backoff(30) <= fetch_kml.BACKOFF_MAX * 1.5
+
+def test_adaptive_limiter():
+    limiter = AdaptiveLimiter(start=2, maximum=3)
+    for _ in range(2):
+        limiter.success()
+    assert limiter.limit == 3
+    for _ in range(10):
+        limiter.success()
+    assert limiter.limit == 3
+    limiter.throttled()
+    limiter.throttled()  # same burst, counted once
+    assert limiter.limit == 1
+    limiter._cut_at = time.monotonic() - 2
+    limiter.throttled()
+    assert limiter.limit == 1
+
+    async def run():
+        peak = 0
+
+        async def task():
+            nonlocal peak
+            async with limiter.slot():
+                peak = max(peak, limiter.active)
+                await asyncio.sleep(0.01)
+
+        limiter.limit = 2
+        await asyncio.gather(*(task() for _ in range(6)))
+        return peak
+
+    assert asyncio.run(run()) == 2
@@ -0,0 +1,95 @@
+import shapely
+from shapely import Point, Polygon
+from ingestion.parse_load import iter_keyed_records, match_legacy_rows, placemark_key
+from ingestion.partitions import LEGACY_TABLE, partition_name
+from utils.geometry import normalize_geometries
+
+KML = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2"><Document>{}</Document></kml>"""
+
+def placemark(name, x, pm_id=None, plot_id=None):
+    attr = f' id="{pm_id}"' if pm_id else ""
+    data = f'<ExtendedData><Data name="plot_id"><value>{plot_id}</value></Data></ExtendedData>' if plot_id else ""
+    return (f"<Placemark{attr}><name>{name}</name>{data}<Polygon><outerBoundaryIs><LinearRing><coordinates>"
+            f"{x},23.5 {x + 0.001},23.5 {x + 0.001},23.501 {x},23.501 {x},23.5"
+            f"</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark>")
+
+def keys(tmp_path, *placemarks):
+    path = tmp_path / "plots.kml"
+    path.write_text(KML.format("".join(placemarks)), encoding="utf-8")
+    return [(source_id, props["name"]) for source_id, props, *_ in iter_keyed_records(str(path), {})]
+
+def test_placemark_key_precedence():
+    assert placemark_key("pm-7", {"plot_id": "42"}, b"wkb") == "id:pm-7"
+    assert placemark_key(None, {"Plot_ID": "42"}, b"wkb") == "plot_id:42"
+    assert placemark_key(None, {"plot_id": ""}, b"wkb").startswith("g:")
+    assert placemark_key(None, {"name": "a"}, None).startswith("p:")
+    assert placemark_key(None, {"name": "a"}, b"one") != placemark_key(None, {"name": "a"}, b"two")
+
+def test_source_ids_survive_insertions(tmp_path):
+    a, b, c = placemark("A", 58.1), placemark("B", 58.2, pm_id="b"), placemark("C", 58.3, plot_id="P-3")
+    before = dict((name, sid) for sid, name in keys(tmp_path, a, b, c))
+    after = dict((name, sid) for sid, name in keys(tmp_path, placemark("New", 58.0), a, c, b))
+    assert all(after[name] == sid for name, sid in before.items())
+    assert before["B"] == "plots.kml::id:b"
+    assert before["C"] == "plots.kml::plot_id:P-3"
+
+def test_source_ids_follow_geometry_not_properties(tmp_path):
+    [(before, _)] = keys(tmp_path, placemark("A", 58.1))
+    [(renamed, _)] = keys(tmp_path, placemark("A renamed", 58.1))
+    [(moved, _)] = keys(tmp_path, placemark("A", 58.5))
+    assert renamed == before
+    assert moved != before
+
+def test_repeated_keys_are_made_unique(tmp_path):
+    ids = [sid for sid, _ in keys(tmp_path, placemark("A", 58.1), placemark("A", 58.1), placemark("A", 58.1))]
+    assert ids[1:] == [ids[0] + "#2", ids[0] + "#3"]
+
+def test_legacy_rows_follow_their_content():
+    new_keys = [("f::g:new", "h-new"), ("f::g:a", "h-a"), ("f::g:c", "h-c")]
+    legacy = [("r0", 0, "h-a"), ("r1", 1, "h-c")]
+    assert match_legacy_rows(legacy, new_keys) == {"r0": "f::g:a", "r1": "f::g:c"}
+
+def test_changed_legacy_rows_fall_back_to_position():
+    new_keys = [("f::g:a", "h-a"), ("f::g:b", "h-b2"), ("f::g:c", "h-c")]
+    legacy = [("r0", 0, "h-a"), ("r1", 1, "h-b1"), ("r2", 2, "h-c"), ("r3", 3, "h-gone"), ("r4", 4, None)]
+    # r3 and r4 have no placemark left and are tombstoned by finish_file
+    assert match_legacy_rows(legacy, new_keys) == {"r0": "f::g:a", "r1": "f::g:b", "r2": "f::g:c"}
+
+def test_normalize_keeps_alignment_and_none():
+    square = Polygon([(58, 23), (58.001, 23), (58.001, 23.001), (58, 23.001)])
+    out = normalize_geometries([None, square, None], grid_size=1e-6)
+    assert len(out) == 3 and out[0] is None and out[2] is None
+    assert out[1].equals(square)
+    assert len(normalize_geometries([])) == 0
+
+def test_normalize_drops_z_and_repeated_points():
+    [g] = normalize_geometries([Polygon([(0, 0, 5), (1, 0, 5), (1, 0, 5), (1, 1, 5), (0, 0, 5)])], grid_size=0)
+    assert not g.has_z
+    assert len(g.exterior.coords) == 4
+
+def test_normalize_repairs_to_polygons():
+    bowtie = Polygon([(0, 0), (1, 1), (1, 0), (0, 1), (0, 0)])
+    spike = Polygon([(0, 0), (2, 0), (2, 1), (3, 1), (2, 1), (2, 2), (0, 2)])
+    for g in normalize_geometries([bowtie, spike], grid_size=1e-6):
+        assert g.is_valid and g.geom_type in ("Polygon", "MultiPolygon")
+    assert normalize_geometries([bowtie], grid_size=1e-6)[0].area == 0.5
+
+def test_normalize_snaps_and_collapses_to_empty():
+    tiny = Polygon([(58, 23), (58 + 1e-9, 23), (58 + 1e-9, 23 + 1e-9)])
+    point, collapsed = normalize_geometries([Point(58.12345678, 23.98765432), tiny], grid_size=1e-6)
+    assert (round(point.x, 6), round(point.y, 6)) == (point.x, point.y) == (58.123457, 23.987654)
+    assert collapsed.is_empty
+
+def test_normalize_orients_rings():
+    clockwise = Polygon([(0, 0), (0, 1), (1, 1), (1, 0)], [[(0.2, 0.2), (0.8, 0.2), (0.8, 0.8), (0.2, 0.8)]])
+    [g] = normalize_geometries([clockwise], grid_size=1e-6)
+    assert shapely.is_ccw(g.exterior) and not shapely.is_ccw(g.interiors[0])
+    assert g.equals(clockwise)
+
+def test_partition_names_are_unique():
+    sources = ["default", "legacy", "Oman-Real", "oman real", "", "x" * 100]
+    names = {partition_name(s) for s in sources}
+    assert len(names) == len(sources)
+    assert not names & {"raw_plots_default", LEGACY_TABLE}
+    assert all(len(n) <= 63 for n in names)
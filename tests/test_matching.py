@@ -0,0 +1,93 @@
+import os
+import uuid
+import psycopg2
+import pytest
+from core.matching import PAIRS_BATCH_SQL, build_clusters, ensure_matching_tables, find_matches
+
+DSN = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DSN, reason="set TEST_DATABASE_URL to a scratch PostGIS database")
+
+@pytest.fixture
+def conn():
+    conn = psycopg2.connect(DSN)
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE EXTENSION IF NOT EXISTS postgis;
+            CREATE SCHEMA matching_test;
+            SET search_path TO matching_test, public;
+            CREATE TABLE raw_plots (
+                raw_id uuid PRIMARY KEY,
+                payload JSONB,
+                geom geometry(Geometry,4326),
+                fetched_at timestamptz DEFAULT now(),
+                deleted_at timestamptz
+            );
+        """)
+        ensure_matching_tables(cur)
+    conn.commit()
+    yield conn
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute("DROP SCHEMA matching_test CASCADE")
+    conn.commit()
+    conn.close()
+
+def add_plots(conn, *names):
+    square = "POLYGON((58.38 23.58, 58.381 23.58, 58.381 23.581, 58.38 23.581, 58.38 23.58))"
+    ids = [str(uuid.uuid4()) for _ in names]
+    with conn.cursor() as cur:
+        for raw_id, name in zip(ids, names):
+            cur.execute("INSERT INTO raw_plots (raw_id, payload, geom) VALUES (%s, %s, ST_GeomFromText(%s, 4326))",
+                        (raw_id, f'{{"name": "{name}"}}', square))
+    conn.commit()
+    return ids
+
+def pairs(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT raw_id_a::text, raw_id_b::text FROM plot_matches ORDER BY 1, 2")
+        return cur.fetchall()
+
+def test_plots_matching_within_one_batch_are_paired_once(conn):
+    ids = sorted(add_plots(conn, "Plot 1", "Plot 1", "Plot 1"))
+    assert find_matches(conn, "-infinity") == 3
+    assert pairs(conn) == [(ids[0], ids[1]), (ids[0], ids[2]), (ids[1], ids[2])]
+
+def test_plots_matching_across_batches_are_paired_once(conn):
+    ids = sorted(add_plots(conn, "Plot 1", "Plot 1", "Plot 1"))
+    assert find_matches(conn, "-infinity", batch_size=1) == 3
+    assert pairs(conn) == [(ids[0], ids[1]), (ids[0], ids[2]), (ids[1], ids[2])]
+
+def test_rerunning_a_batch_updates_pairs(conn):
+    ids = add_plots(conn, "Plot 1", "Plot 1")
+    params = {"ids": ids, "tolerance": 1e-4, "m_per_deg": 111320.0, "iou": 0.8, "hausdorff": 5.0, "name": 0.5}
+    with conn.cursor() as cur:
+        cur.execute(PAIRS_BATCH_SQL, params)
+        cur.execute(PAIRS_BATCH_SQL, params)
+    assert len(pairs(conn)) == 1
+
+def clusters(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT raw_id::text, cluster_id::text FROM plot_clusters ORDER BY 1")
+        return dict(cur.fetchall())
+
+def test_clusters_are_rebuilt_only_where_pairs_changed(conn):
+    ids = add_plots(conn, "Plot 1", "Plot 1", "Plot 1")
+    touched = set()
+    find_matches(conn, "-infinity", touched=touched)
+    assert build_clusters(conn, touched) == 1
+    assert len(set(clusters(conn).values())) == 1 and len(clusters(conn)) == 3
+    with conn.cursor() as cur:
+        cur.execute("SELECT now()")
+        since = cur.fetchone()[0]
+        cur.execute("UPDATE raw_plots SET deleted_at = now() WHERE raw_id = %s", (ids[0],))
+        # A cluster elsewhere that this run must leave alone
+        cur.execute("INSERT INTO plot_clusters VALUES (gen_random_uuid(), gen_random_uuid(), true)")
+    conn.commit()
+    before = clusters(conn)
+    touched = set()
+    find_matches(conn, since, touched=touched)
+    assert build_clusters(conn, touched) == 1
+    after = clusters(conn)
+    assert ids[0] not in after and set(ids[1:]) <= set(after)
+    assert len(after) == 3 and set(before) - set(ids) <= set(after)
+
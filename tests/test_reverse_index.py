@@ -0,0 +1,82 @@
+import os
+import numpy as np
+import pytest
+import shapely
+from app.core.reverse_index import ReverseIndex
+
+LAT = 23.6  # Muscat
+
+def index(*geoms):
+    reverse = ReverseIndex(None)
+    n = len(geoms)
+    reverse._apply(None, np.arange(1, n + 1), np.array([f"C{i}" for i in range(1, n + 1)], dtype=object),
+                   np.array(["W"] * n, dtype=object), np.array(geoms, dtype=object))
+    return reverse
+
+def test_contained_and_out_of_range():
+    reverse = index(shapely.box(58.4, LAT, 58.401, LAT + 0.001))
+    assert reverse.lookup(58.4005, LAT + 0.0005)["contained"]
+    assert reverse.lookup(58.5, LAT) is None
+    assert reverse.lookup(58.5, LAT, max_distance_m=20000)["distance_m"] == pytest.approx(10104.3, rel=1e-3)
+
+# Geodesic distances (WGS84) for 0.002 degrees east and 0.0018 degrees north
+# of (58.4, 23.6), as PostGIS geography reports them
+@pytest.mark.parametrize("box, metres", [
+    (shapely.box(58.402, LAT - 0.001, 58.403, LAT + 0.001), 204.128),
+    (shapely.box(58.399, LAT + 0.0018, 58.401, LAT + 0.002), 199.354),
+])
+def test_distance_matches_geography_near_the_radius(box, metres):
+    reverse = index(box)
+    hit = reverse.lookup(58.4, LAT, max_distance_m=metres + 0.5)
+    assert not hit["contained"]
+    assert hit["distance_m"] == pytest.approx(metres, abs=0.05)
+    assert reverse.lookup(58.4, LAT, max_distance_m=metres - 0.5) is None
+
+def test_nearest_is_nearest_in_metres():
+    # 0.0016 degrees north is closer in degrees, 0.0017 east is closer on the ground (173 m vs 177 m)
+    east = shapely.box(58.4017, LAT - 0.001, 58.402, LAT + 0.001)
+    north = shapely.box(58.399, LAT + 0.0016, 58.401, LAT + 0.002)
+    assert index(east, north).lookup(58.4, LAT)["canonical_code"] == "C1"
+
+def test_lookup_many_matches_lookup():
+    reverse = index(shapely.box(58.4, LAT, 58.401, LAT + 0.001), shapely.box(58.41, LAT, 58.411, LAT + 0.001))
+    lons, lats = [58.4005, 58.4099, 58.42, 58.4105], [LAT + 0.0005, LAT + 0.0005, LAT, LAT - 0.001]
+    assert reverse.lookup_many(lons, lats) == [reverse.lookup(x, y) for x, y in zip(lons, lats)]
+
+DSN = os.environ.get("TEST_DATABASE_URL")
+
+@pytest.mark.skipif(not DSN, reason="set TEST_DATABASE_URL to a scratch PostGIS database")
+def test_lookup_agrees_with_knn_sql():
+    from sqlalchemy import create_engine, text
+    from app.api.addresses import REVERSE_KNN_SQL
+    engine = create_engine(DSN.replace("postgresql+asyncpg", "postgresql"),
+                           connect_args={"options": "-csearch_path=reverse_test,public"})
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE EXTENSION IF NOT EXISTS postgis;
+            CREATE SCHEMA reverse_test;
+            CREATE TABLE reverse_test.addresses (
+                address_id INTEGER PRIMARY KEY,
+                canonical_code TEXT,
+                wilayat_code TEXT,
+                geom geometry(Geometry,4326),
+                deleted_at timestamptz,
+                change_xid BIGINT NOT NULL DEFAULT 0
+            );
+            INSERT INTO reverse_test.addresses VALUES
+                (1, 'C1', 'W', ST_MakeEnvelope(58.402, 23.599, 58.403, 23.601, 4326)),
+                (2, 'C2', 'W', ST_MakeEnvelope(58.399, 23.6018, 58.401, 23.602, 4326));
+        """))
+    try:
+        reverse = ReverseIndex(engine)
+        reverse.refresh()
+        lons, lats = [58.4, 58.4005, 58.3985], [23.6, 23.5995, 23.6004]
+        with engine.connect() as conn:
+            rows = conn.execute(REVERSE_KNN_SQL, {"lons": lons, "lats": lats}).mappings().all()
+        for hit, row in zip(reverse.lookup_many(lons, lats, max_distance_m=1000), rows):
+            assert hit["address_id"] == row["address_id"]
+            assert hit["distance_m"] == pytest.approx(row["distance_m"], abs=0.05)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DROP SCHEMA reverse_test CASCADE"))
+        engine.dispose()
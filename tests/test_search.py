@@ -0,0 +1,37 @@
+import pytest
+from utils.text import SEARCH_TEXT_MAX_CHARS, normalize_text, query_forms, search_text, search_tokens
+
+@pytest.mark.parametrize("value, expected", [
+    ("مَطْرَح", "مطرح"),  # harakat
+    ("مطـــرح", "مطرح"),  # tatweel
+    ("أحمد إبراهيم آمنة", "احمد ابراهيم امنه"),  # alef forms, taa marbuta
+    ("مصطفى", "مصطفي"),  # alef maqsura
+    ("١٢٣ ۴۵", "123 45"),  # Arabic-Indic digits
+    ("Ṣūr", "sur"),  # Latin accents
+    ("  Muscat—Ruwi!! ", "muscat ruwi"),
+    ("plot_no", "plot no"),
+])
+def test_normalize_text(value, expected):
+    assert normalize_text(value) == expected
+
+def test_arabic_and_latin_spellings_share_tokens():
+    latin = set(search_tokens("Mutrah"))
+    assert latin & set(search_tokens("مطرح"))
+    assert latin & set(search_tokens("مَطْرَح"))
+    # Vowel spellings meet on the consonant skeleton, the article is dropped
+    assert set(search_tokens("Seeb")) & set(search_tokens("السيب"))
+    assert set(search_tokens("Suwaiq")) & set(search_tokens("Swaiq"))
+
+def test_query_forms():
+    assert query_forms("Mutrah") == ("mutrah", "mutrah", "mtrh")
+    assert query_forms("مَطْرَح") == ("مطرح", "mtrh", "mtrh")
+    assert query_forms("السيب") == ("السيب", "syb", "sb")
+    # Digits and short words are not reduced to skeletons
+    assert query_forms("١٢٣ Al") == ("123 al", "123 al", "123 al")
+    assert query_forms("") == ("", "", "")
+
+def test_search_text():
+    text = search_text({"name": "<b>Al Suwaiq</b>", "area": 5, "name_ar": "السويق", "empty": ""}).split()
+    assert "suwaiq" in text and "السويق" in text and "b" not in text
+    assert search_text({"area": 5}) is None
+    assert len(search_text({"notes": "word " * 1000})) <= SEARCH_TEXT_MAX_CHARS
@@ -0,0 +1,61 @@
+# geometry.py
+import math
+import numpy as np
+import shapely
+import config
+
+def parse_bbox(value):
+    """Parse "minx,miny,maxx,maxy" (lon/lat) into a tuple of floats."""
+    parts = value.split(",")
+    if len(parts) != 4:
+        raise ValueError("bbox must be minx,miny,maxx,maxy")
+    minx, miny, maxx, maxy = (float(p) for p in parts)
+    if not all(map(math.isfinite, (minx, miny, maxx, maxy))):
+        raise ValueError("bbox values must be finite numbers")
+    if minx > maxx or miny > maxy:
+        raise ValueError("bbox min must not exceed max")
+    return minx, miny, maxx, maxy
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+def metres_per_degree(lat):
+    """(east, north) metres per degree of longitude and latitude at lat on the WGS84 ellipsoid.
+
+    Over a few hundred metres this matches PostGIS geography distances to
+    well under a metre. lat may be an array.
+    """
+    phi = np.radians(lat)
+    w = 1 - WGS84_E2 * np.sin(phi) ** 2
+    east = np.radians(1) * WGS84_A / np.sqrt(w) * np.cos(phi)
+    north = np.radians(1) * WGS84_A * (1 - WGS84_E2) / w ** 1.5
+    return east, north
+
+def bbox_intersects(a, b):
+    """True if two (minx, miny, maxx, maxy) boxes overlap or touch."""
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def normalize_geometries(geoms, grid_size=None):
+    """Clean a batch of Shapely geometries with one array call per step.
+
+    Drops Z, removes repeated vertices, repairs invalid geometries (keeping
+    polygons polygonal), snaps coordinates to a grid_size grid (degrees) and
+    orients polygon shells counter-clockwise, holes clockwise. Returns a
+    numpy object array aligned with geoms; None stays None, and a plot that
+    collapses below the grid comes back empty.
+    """
+    grid_size = config.GEOMETRY_GRID_SIZE if grid_size is None else grid_size
+    out = np.empty(len(geoms), dtype=object)
+    out[:] = geoms
+    present = ~shapely.is_missing(out)
+    g = shapely.force_2d(out[present])
+    g = shapely.remove_repeated_points(g)
+    invalid = ~shapely.is_valid(g)
+    if invalid.any():
+        g[invalid] = shapely.make_valid(g[invalid], method="structure", keep_collapsed=False)
+    if grid_size:
+        # Default mode keeps the output valid, merging vertices that snap together
+        g = shapely.set_precision(g, grid_size)
+    out[present] = shapely.orient_polygons(g)
+    return out
@@ -0,0 +1,89 @@
+# text.py
+# Search keys for Arabic and English place text. Both sides of a search go
+# through the same folding, so "Mutrah", "مطرح" and "مَطْرَح" meet on common
+# tokens in raw_plots.search_text.
+import re
+import unicodedata
+
+# Harakat, tanween, shadda, sukun, superscript alef, Quranic marks, tatweel
+ARABIC_MARKS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+HTML_TAG = re.compile(r"<[^>]*>")
+NON_WORD = re.compile(r"[^\w]+|_")
+ARABIC_LETTER = re.compile("[\u0621-\u064a]")
+LATIN_WORD = re.compile("^[a-z0-9]+$")
+VOWELS = re.compile("[aeiouy]")
+REPEATS = re.compile(r"(.)\1+")
+SEARCH_TEXT_MAX_CHARS = 2000
+
+FOLD = str.maketrans({
+    # alef forms, alef maqsura and Farsi yaa, taa marbuta, hamza carriers, Farsi kaf
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ی": "ي",
+    "ة": "ه",
+    "ؤ": "و", "ئ": "ي",
+    "ک": "ك",
+    # Arabic-Indic and Eastern Arabic-Indic digits
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+    **{chr(0x06f0 + d): str(d) for d in range(10)},
+})
+
+# Consonant skeleton transliteration; vowels are mostly unwritten in Arabic
+TRANSLIT = str.maketrans({
+    "ا": "a", "ب": "b", "ت": "t", "ث": "th", "ج": "j", "ح": "h", "خ": "kh", "د": "d",
+    "ذ": "dh", "ر": "r", "ز": "z", "س": "s", "ش": "sh", "ص": "s", "ض": "d", "ط": "t",
+    "ظ": "z", "ع": "", "غ": "gh", "ف": "f", "ق": "q", "ك": "k", "ل": "l", "م": "m",
+    "ن": "n", "ه": "h", "و": "w", "ي": "y", "ء": "",
+})
+
+def normalize_text(value):
+    """Case-fold, strip Arabic and Latin diacritics, fold letter variants and digits, drop punctuation."""
+    value = unicodedata.normalize("NFKC", value).casefold()
+    value = ARABIC_MARKS.sub("", value).translate(FOLD)
+    # Latin accents: decompose and drop combining marks (Arabic marks are gone already)
+    value = "".join(c for c in unicodedata.normalize("NFD", value) if not unicodedata.combining(c))
+    return " ".join(NON_WORD.sub(" ", value).split())
+
+def transliterate(word):
+    """Latin spelling of a normalized Arabic word; the article "ال" is dropped."""
+    if word.startswith("ال") and len(word) > 3:
+        word = word[2:]
+    return word.translate(TRANSLIT)
+
+def skeleton(word):
+    """Consonants of a Latin word, so vowel spellings (Seeb/Sib, Suwaiq/Swyq) compare equal."""
+    if word.startswith(("al", "el")) and len(word) > 4:
+        word = word[2:]
+    word = word.replace("c", "k").replace("q", "k").replace("ph", "f")
+    return REPEATS.sub(r"\1", VOWELS.sub("", word)) or word
+
+def is_skeletal(word):
+    return len(word) >= 3 and LATIN_WORD.match(word) is not None and not word.isdigit()
+
+def search_tokens(text):
+    """Normalized words, plus transliterations of Arabic words and consonant skeletons of Latin ones."""
+    tokens = []
+    for word in normalize_text(text).split():
+        tokens.append(word)
+        latin = transliterate(word) if ARABIC_LETTER.search(word) else word
+        if latin != word:
+            tokens.append(latin)
+        if is_skeletal(latin):
+            tokens.append(skeleton(latin))
+    return list(dict.fromkeys(t for t in tokens if t))
+
+def search_text(props):
+    """raw_plots.search_text for a placemark's properties: every text value, folded into search tokens."""
+    values = []
+    for value in props.values():
+        if isinstance(value, str) and value:
+            values.append(HTML_TAG.sub(" ", value))
+    text = " ".join(search_tokens(" ".join(values)))
+    return text[:SEARCH_TEXT_MAX_CHARS] or None
+
+def query_forms(query):
+    """(normalized, alternate, skeleton) forms of a search query; alternate and skeleton may repeat normalized."""
+    normalized = normalize_text(query)
+    words = normalized.split()
+    latin = [transliterate(w) if ARABIC_LETTER.search(w) else w for w in words]
+    skeletons = [skeleton(w) if is_skeletal(w) else w for w in latin]
+    return normalized, " ".join(latin), " ".join(skeletons)